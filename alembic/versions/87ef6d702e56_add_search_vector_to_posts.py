@@ -0,0 +1,36 @@
+"""add search_vector to posts
+
+Revision ID: 87ef6d702e56
+Revises: ba88206f3d3c
+Create Date: 2026-10-18 10:41:09.316274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '87ef6d702e56'
+down_revision = 'ba88206f3d3c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # ! adding a stored generated column rewrites the posts table
+    op.add_column(
+        'posts',
+        sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('english', title || ' ' || content)", persisted=True))
+    )
+    op.create_index('ix_posts_search_vector', 'posts', ['search_vector'], postgresql_using='gin')
+    pass
+
+
+def downgrade() -> None:
+    op.drop_index('ix_posts_search_vector', table_name='posts')
+    op.drop_column('posts', 'search_vector')
+    pass
@@ -0,0 +1,30 @@
+"""add vote_count to posts
+
+Revision ID: ba88206f3d3c
+Revises: fa4f132dbc44
+Create Date: 2026-10-18 10:02:47.581932
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ba88206f3d3c'
+down_revision = 'fa4f132dbc44'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # ! existing rows start at 0, run `python -m app.backfill` once after upgrading
+    op.add_column(
+        'posts',
+        sa.Column('vote_count', sa.Integer(), nullable=False, server_default='0')
+    )
+    pass
+
+
+def downgrade() -> None:
+    op.drop_column('posts', 'vote_count')
+    pass
@@ -0,0 +1,40 @@
+"""add posts owner_id and votes post_id indexes
+
+Revision ID: c3e1a9d27f64
+Revises: 87ef6d702e56
+Create Date: 2026-10-18 14:02:47.518903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e1a9d27f64'
+down_revision = '87ef6d702e56'
+branch_labels = None
+depends_on = None
+
+
+# ? posts.owner_id: owner filter of the export, cascade from users
+# ? votes.post_id: cascade from posts and the backfill join - the votes pk (user_id, post_id) can't serve post_id alone
+INDEXES = [
+    ('ix_posts_owner_id', 'posts', ['owner_id']),
+    ('ix_votes_post_id', 'votes', ['post_id']),
+]
+
+
+def upgrade() -> None:
+    # ! CONCURRENTLY doesn't block writes while building, but can't run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}') # ! leftover INVALID index of a failed build
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+    pass
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
+    pass
@@ -0,0 +1,48 @@
+"""add hot_score to posts
+
+Revision ID: e5b2f7c90a13
+Revises: c3e1a9d27f64
+Create Date: 2026-10-18 14:41:26.702155
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b2f7c90a13'
+down_revision = 'c3e1a9d27f64'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_posts_hot_score_id', 'posts', ['hot_score', 'id']),
+    ('ix_posts_vote_count_id', 'posts', ['vote_count', 'id']),
+]
+
+
+def upgrade() -> None:
+    # ! adding a stored generated column rewrites the posts table
+    op.add_column(
+        'posts',
+        sa.Column(
+            'hot_score',
+            sa.Float(),
+            sa.Computed(
+                "log(greatest(vote_count, 1)) + extract(epoch from created_at - to_timestamp(0)) / 45000",
+                persisted=True))
+    )
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}') # ! leftover INVALID index of a failed build
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+    pass
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
+    op.drop_column('posts', 'hot_score')
+    pass
@@ -0,0 +1,26 @@
+"""add posts created_at id index
+
+Revision ID: fa4f132dbc44
+Revises: a4fb40ce068e
+Create Date: 2026-10-18 09:12:31.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'fa4f132dbc44'
+down_revision = 'a4fb40ce068e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_posts_created_at_id', 'posts', ['created_at', 'id'])
+    pass
+
+
+def downgrade() -> None:
+    op.drop_index('ix_posts_created_at_id', table_name='posts')
+    pass
@@ -0,0 +1,45 @@
+# ? one-off backfill of the denormalized posts.vote_count column from the votes table
+# ? usage: python -m app.backfill
+# ! with vote_counter_enabled, run it while the API is stopped: deltas still buffered in memory would be added on top
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import sync_session
+
+
+BATCH_SIZE = 10000
+
+def backfill_vote_counts(db: Session, batch_size: int = BATCH_SIZE) -> int:
+    # ! walks posts by id range and commits every batch, so row locks are only held briefly
+    max_id = db.query(func.max(models.Post.id)).scalar() or 0
+    updated = 0
+
+    for start in range(0, max_id + 1, batch_size):
+        # ! lock the batch before counting: a vote in flight either committed already (and is counted) or waits
+        # ! for this commit and adds its +1/-1 on top - otherwise it could commit between the count and the
+        # ! UPDATE and be overwritten
+        db.execute(text("SELECT id FROM posts WHERE id >= :start AND id < :end ORDER BY id FOR UPDATE"),
+                   {"start": start, "end": start + batch_size})
+        result = db.execute(text("""
+            UPDATE posts SET vote_count = counts.votes
+            FROM (
+                SELECT posts.id, count(votes.post_id) AS votes
+                FROM posts LEFT JOIN votes ON votes.post_id = posts.id
+                WHERE posts.id >= :start AND posts.id < :end
+                GROUP BY posts.id
+            ) AS counts
+            WHERE posts.id = counts.id AND posts.vote_count <> counts.votes
+        """), {"start": start, "end": start + batch_size})
+        db.commit()
+        updated += result.rowcount
+
+    return updated
+
+
+if __name__ == "__main__":
+    db = sync_session()
+    try:
+        print(f"updated vote_count on {backfill_vote_counts(db)} posts")
+    finally:
+        db.close()
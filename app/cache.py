@@ -0,0 +1,233 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+import orjson
+from fastapi import Response
+
+from .config import Settings, defaults
+
+
+class TTLCache:
+    # ? in-process LRU where every entry also expires after `ttl` seconds
+    def __init__(self, max_size: int, ttl: float, timer: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.timer = timer
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+
+        value, expires_at = entry
+        if expires_at <= self.timer():
+            del self._entries[key]
+            self.evictions += 1
+            return default
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._entries[key] = (value, self.timer() + (self.ttl if ttl is None else ttl))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def resize(self, max_size: int, ttl: float):
+        # ! entries already stored keep their expiry
+        self.max_size = max_size
+        self.ttl = ttl
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# ? response cache backends: values are bytes, and generation counters expire `counter_ttl` after their last bump
+# ! a counter that expires restarts at 0, so it must outlive every entry stored under its old generations -
+# ! entries live `ttl`, and a late write (see ResponseCache.post_key) lands at most one request after the bump
+def counter_ttl(ttl: float) -> float:
+    return max(10 * ttl, 300)
+
+
+class MemoryBackend:
+    def __init__(self, max_size: int, ttl: float, timer: Callable[[], float] = time.monotonic):
+        self._entries = TTLCache(max_size, ttl, timer)
+        self.timer = timer
+        self.counter_ttl = counter_ttl(ttl)
+        self._counters: "OrderedDict[str, tuple]" = OrderedDict() # ! in bump order, which is also expiry order
+
+    @property
+    def evictions(self) -> int:
+        return self._entries.evictions
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._entries.get(key)
+
+    async def set(self, key: str, value: bytes):
+        self._entries.set(key, value)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._entries.delete(key)
+
+    async def counter(self, key: str) -> int:
+        value, expires_at = self._counters.get(key, (0, None))
+        return value if expires_at is None or expires_at > self.timer() else 0
+
+    async def incr(self, key: str) -> int:
+        now = self.timer()
+        while self._counters:
+            oldest, (_, expires_at) = next(iter(self._counters.items()))
+            if expires_at > now:
+                break
+            del self._counters[oldest]
+
+        value = self._counters.pop(key, (0, None))[0] + 1
+        self._counters[key] = (value, now + self.counter_ttl)
+        return value
+
+    async def clear(self):
+        self._entries.clear()
+        self._counters.clear()
+
+
+class RedisBackend:
+    # ? shared between workers, so invalidations reach every process - `client` is a redis.asyncio.Redis
+    # ? or anything with the same async get/set/delete/incr methods (e.g. a stub in tests)
+    evictions = 0 # ! redis evicts on its own, see `INFO stats` evicted_keys
+
+    def __init__(self, client, ttl: float, namespace: str = "api-cache"):
+        self.client = client
+        self.ttl = ttl
+        self.counter_ttl = counter_ttl(ttl)
+        self.namespace = namespace
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(f"{self.namespace}:{key}")
+
+    async def set(self, key: str, value: bytes):
+        await self.client.set(f"{self.namespace}:{key}", value, ex=max(1, round(self.ttl)))
+
+    async def delete(self, *keys: str):
+        await self.client.delete(*(f"{self.namespace}:{key}" for key in keys))
+
+    async def counter(self, key: str) -> int:
+        return int(await self.client.get(f"{self.namespace}:{key}") or 0)
+
+    async def incr(self, key: str) -> int:
+        value = await self.client.incr(f"{self.namespace}:{key}")
+        await self.client.expire(f"{self.namespace}:{key}", round(self.counter_ttl))
+        return value
+
+    async def clear(self):
+        pass
+
+
+class NullBackend:
+    evictions = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return None
+
+    async def set(self, key: str, value: bytes):
+        pass
+
+    async def delete(self, *keys: str):
+        pass
+
+    async def counter(self, key: str) -> int:
+        return 0
+
+    async def incr(self, key: str) -> int:
+        return 0
+
+    async def clear(self):
+        pass
+
+
+class ResponseCache:
+    # ? caches whole JSON responses of the post feed and post detail
+    # ! feed pages can't be found by post id, so they are keyed on a generation number that every write bumps
+    # ! a post's detail is keyed on its own generation: a reader that loaded the row before a write can only
+    # ! store the old body under the old generation, which nobody reads anymore
+    cached_headers = ("x-next-cursor", "etag")
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    async def feed_key(self, **params) -> str:
+        generation = await self.backend.counter("posts:feed:generation")
+        # ! the params are user input: serialized (not joined with &/=) so two requests can't build the same key,
+        # ! and hashed so a long search doesn't make a long key
+        query = hashlib.sha256(orjson.dumps(params, option=orjson.OPT_SORT_KEYS)).hexdigest()
+        return f"posts:feed:{generation}:{query}"
+
+    async def post_key(self, id: int) -> str:
+        # ! read before the row is loaded, see get_post
+        generation = await self.backend.counter(f"posts:{id}:generation")
+        return f"posts:{id}:{generation}"
+
+    async def get(self, key: str) -> Optional[Response]:
+        value = await self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        headers, body = value.split(b"\n", 1) # ! orjson output never contains a raw newline
+        return Response(body, media_type="application/json", headers=orjson.loads(headers))
+
+    async def set(self, key: str, response: Response):
+        headers = {name: value for name, value in response.headers.items() if name in self.cached_headers}
+        await self.backend.set(key, orjson.dumps(headers) + b"\n" + response.body)
+
+    async def invalidate_feed(self):
+        await self.backend.incr("posts:feed:generation")
+
+    async def invalidate_posts(self, *ids: int):
+        stale = []
+        for id in ids:
+            generation = await self.backend.incr(f"posts:{id}:generation")
+            stale.append(f"posts:{id}:{generation - 1}") # ! unreachable now, only dropped to free the space early
+        if stale:
+            await self.backend.delete(*stale)
+        await self.invalidate_feed()
+
+    async def clear(self):
+        await self.backend.clear()
+
+    def snapshot(self) -> dict:
+        return {"backend": type(self.backend).__name__, "hits": self.hits, "misses": self.misses,
+                "evictions": self.backend.evictions}
+
+
+def build_backend(app_settings: Settings):
+    if app_settings.cache_backend == "redis":
+        import redis.asyncio as redis # ! optional dependency, only needed for this backend
+        return RedisBackend(redis.from_url(app_settings.redis_url), app_settings.cache_ttl_seconds)
+    if app_settings.cache_backend == "memory":
+        return MemoryBackend(app_settings.cache_max_size, app_settings.cache_ttl_seconds)
+    return NullBackend()
+
+
+response_cache = ResponseCache(build_backend(defaults))
+
+def configure(app_settings: Settings):
+    response_cache.backend = build_backend(app_settings)
@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from pydantic import BaseSettings
 
 
@@ -10,9 +12,64 @@ class Settings(BaseSettings):
     secret_key: str
     algorithm: str
     access_token_expire_minutes: int
+    jwt_backend: str = "jose" # ! jose, or pyjwt (needs the PyJWT package - faster, and the only one with EdDSA)
+    jwt_private_key: Optional[str] = None # ! PEM, signs the tokens when `algorithm` is asymmetric (ES256, EdDSA, RS256...)
+    jwt_public_key: Optional[str] = None # ! PEM, verifies them (derived from jwt_private_key when not set)
+    token_cache_max_size: int = 10000
+    token_cache_ttl_seconds: float = 300 # ! a verified token is trusted this long without re-checking it, never past its exp
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_pool_timeout: float = 30
+    database_pool_recycle: int = -1
+    database_pool_pre_ping: bool = False
+    database_replica_urls: List[str] = [] # ! e.g. DATABASE_REPLICA_URLS='["postgresql://user:pw@replica1:5432/db"]'
+    replica_sticky_seconds: float = 5 # ! reads of a user go to the primary this long after their last write
+    database_pgbouncer: bool = False # ! NullPool and no server-side prepared statements (transaction pooling)
+    user_cache_max_size: int = 1024
+    user_cache_ttl_seconds: float = 60
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 4
+    password_hash_max_queue: int = 64 # ! hashes waiting for a worker before new ones get a 503
+    vote_batch_max_size: int = 500
+    vote_counter_enabled: bool = False # ! buffer posts.vote_count deltas in memory, see app/counters.py
+    vote_flush_seconds: float = 1
+    cache_backend: str = "memory" # ! memory (per process), redis (shared, needs redis_url and the redis package) or none
+    cache_max_size: int = 1024
+    cache_ttl_seconds: float = 30
+    redis_url: Optional[str] = None
+    post_bulk_max_size: int = 10000
+    sql_instrumentation: bool = False # ! Server-Timing header + one log line per request with its SQL count and time
+    slow_query_ms: float = 200 # ! statements slower than this are logged on their own (with sql_instrumentation)
+    export_batch_size: int = 1000 # ! rows fetched from the server-side cursor per chunk of GET /posts/export
 
     class Config:
         env_file = ".env"
 
 
-settings = Settings()
\ No newline at end of file
+class LazySettings:
+    # ? stands in for the Settings instance everywhere: the environment and .env are only read on first use
+    # ? (not at import), and create_app() swaps in the Settings it was given
+    def __init__(self):
+        object.__setattr__(self, "_settings", None)
+
+    def configure(self, app_settings: Settings):
+        object.__setattr__(self, "_settings", app_settings)
+
+    def get(self) -> Settings:
+        if self._settings is None:
+            self.configure(Settings())
+        return self._settings
+
+    def __getattr__(self, name: str):
+        return getattr(self.get(), name)
+
+    def __setattr__(self, name: str, value):
+        setattr(self.get(), name, value)
+
+
+# settings = Settings()   # ! old - read the environment at import time
+settings = LazySettings()
+
+# ? field defaults only, nothing read from the environment: what the module level singletons (caches, vote
+# ? counter, password hasher...) start with, until create_app() configures them with the app's settings
+defaults = Settings.construct()
\ No newline at end of file
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from sqlalchemy import Integer, column, update, values
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .cache import response_cache
+from .config import Settings, defaults
+
+
+logger = logging.getLogger("app.counters")
+
+# ! 2 bind parameters per post, asyncpg allows at most 32767 per statement
+FLUSH_CHUNK_SIZE = 10000
+
+
+class VoteCounter:
+    # ? buffers posts.vote_count deltas in process memory: a vote only writes its votes row, and the
+    # ? posts rows are updated in one batched statement per flush instead of once per vote (no row-lock hotspot
+    # ? on popular posts). Reads add the pending delta, so /posts shows the same counts either way
+    # ! sort=hot/top read posts.vote_count and trail by up to one flush interval
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.flushes = 0
+        self.flushed_deltas = 0
+        self.failed_flushes = 0
+        self._pending: Dict[int, int] = {}
+        self._flushing: Dict[int, int] = {} # ! taken out of _pending but not committed yet, still counted by reads
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+    def add(self, deltas: Dict[int, int]):
+        if not self.enabled: # ! the vote statement already updated posts.vote_count
+            return
+        for post_id, delta in deltas.items():
+            self._pending[post_id] = self._pending.get(post_id, 0) + delta
+
+    def pending(self, post_id: int) -> int:
+        return self._pending.get(post_id, 0) + self._flushing.get(post_id, 0)
+
+    def version(self, post_id: int, xmin) -> str:
+        # ? buffered votes don't touch the posts row, so its xmin alone would make a stale etag
+        pending = self.pending(post_id)
+        return f"{xmin}.{pending}" if pending else str(xmin)
+
+    async def flush(self, db: AsyncSession) -> int:
+        if self._flushing or not self._pending: # ! a flush is already running, or nothing to do
+            return 0
+
+        self._flushing = {post_id: delta for post_id, delta in self._pending.items() if delta}
+        self._pending = {}
+        try:
+            deltas = list(self._flushing.items())
+            for start in range(0, len(deltas), FLUSH_CHUNK_SIZE):
+                chunk = values(column("id", Integer), column("delta", Integer), name="deltas").data(
+                    deltas[start:start + FLUSH_CHUNK_SIZE])
+                await db.execute(
+                    update(models.Post).where(models.Post.id == chunk.c.id).values(
+                        vote_count=models.Post.vote_count + chunk.c.delta).execution_options(synchronize_session=False))
+            await db.commit()
+        except Exception:
+            self.failed_flushes += 1
+            self.add(self._flushing) # ! nothing was committed, the next flush retries these deltas
+            raise
+        finally:
+            flushed, self._flushing = self._flushing, {}
+
+        self.flushes += 1
+        self.flushed_deltas += len(flushed)
+        if flushed:
+            # ! with a shared (redis) cache, other workers may have cached these posts without this worker's
+            # ! pending deltas; the feed goes too, sort=hot/top pages move with the new counts
+            await response_cache.invalidate_posts(*flushed)
+        return len(flushed)
+
+    async def run(self, session_factory, interval: float):
+        # ! woken up by stop() instead of cancelled, so a flush never gets interrupted halfway
+        stopping = False
+        while not stopping:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), interval)
+                stopping = True
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                async with session_factory() as db:
+                    await self.flush(db)
+            except Exception:
+                logger.exception("vote count flush failed, retrying at the next interval")
+
+    def start(self, session_factory, interval: float):
+        if self.enabled and self._task is None:
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self.run(session_factory, interval))
+
+    async def stop(self, session_factory):
+        # ? on shutdown: the periodic task runs its last flush and exits, anything left after it is flushed here
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+
+        if self._pending:
+            async with session_factory() as db:
+                await self.flush(db)
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "pending_posts": len(self._pending),
+            "flushes": self.flushes,
+            "flushed_deltas": self.flushed_deltas,
+            "failed_flushes": self.failed_flushes,
+        }
+
+
+vote_counter = VoteCounter(defaults.vote_counter_enabled)
+
+def configure(app_settings: Settings):
+    vote_counter.enabled = app_settings.vote_counter_enabled
@@ -1,27 +1,186 @@
+import itertools
+import time
+from typing import List, Optional
+
+from fastapi import Depends
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import time 
-from .config import settings
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool
+from .cache import TTLCache
+from .config import Settings, defaults, settings
+from .metrics import InstrumentedQueuePool, pool_metrics, query_timer
+
+
+def database_url(app_settings: Settings = settings) -> str:
+    return f"postgresql://{app_settings.database_username}:{app_settings.database_password}@{app_settings.database_hostname}:{app_settings.database_port}/{app_settings.database_name}"
+
+def async_database_url(url: str) -> str:
+    return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+# SQLALCHEMY_DATABASE_URL = database_url()   # ! old - read the settings at import time, see database_url()
 
+def pool_options(app_settings: Settings = settings) -> dict:
+    if app_settings.database_pgbouncer:
+        # ! pgbouncer does the pooling, a second pool in front of it would only pin server connections
+        return {"poolclass": NullPool, "pool_pre_ping": app_settings.database_pool_pre_ping}
 
-SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}"
+    return {
+        "pool_size": app_settings.database_pool_size,
+        "max_overflow": app_settings.database_max_overflow,
+        "pool_timeout": app_settings.database_pool_timeout,
+        "pool_recycle": app_settings.database_pool_recycle,
+        "pool_pre_ping": app_settings.database_pool_pre_ping,
+    }
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+def async_engine_options(app_settings: Settings = settings) -> dict:
+    if app_settings.database_pgbouncer:
+        # ! in transaction pooling mode a prepared statement can land on another server connection,
+        # ! so asyncpg's statement cache is disabled (the sqlalchemy side is disabled in the url)
+        return {**pool_options(app_settings), "connect_args": {"statement_cache_size": 0}}
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return {**pool_options(app_settings), "poolclass": InstrumentedQueuePool}
+
+def create_api_engine(async_url: str, app_settings: Settings = settings):
+    url = make_url(async_url)
+    if app_settings.database_pgbouncer:
+        url = url.update_query_dict({"prepared_statement_cache_size": "0"}) # ! keeps the url's own query (e.g. ?ssl=require)
+    api_engine = create_async_engine(url, **async_engine_options(app_settings))
+
+    pool_metrics.attach(api_engine.sync_engine)
+    if app_settings.sql_instrumentation:
+        query_timer.attach(api_engine.sync_engine)
+    return api_engine
+
+
+# ? engines are built by the app's startup hook (init_engines), or on first use - importing this module
+# ? loads no database driver and opens nothing
+engine = None           # blocking engine, only for scripts (e.g. app.backfill) - the API itself runs on async_engine
+SessionLocal = None
+async_engine = None
+AsyncSessionLocal = None
 
 Base = declarative_base()
 
 # Dependency
-def get_db():
-    db = SessionLocal()
+async def get_db():
+    db = async_session()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
+
+class ReplicaRouter:
+    # ? picks the engine for a read: replicas round-robin, except for users who wrote in the last
+    # ? `sticky_seconds` (read-your-writes) - they stay on the primary until the replicas have caught up
+    # ! the recent writers live in process memory, so with several workers stickiness holds per worker
+    def __init__(self, replicas: List, sticky_seconds: float, max_users: int = 100_000):
+        self.set_replicas(replicas)
+        self.sticky_seconds = sticky_seconds
+        self._recent_writers = TTLCache(max_users, sticky_seconds)
+        self.last_write = float("-inf")
+        self.replica_reads = 0
+        self.primary_reads = 0
+
+    def set_replicas(self, replicas: List):
+        self.replicas = replicas
+        self._turn = itertools.cycle(replicas)
+
+    def set_sticky_seconds(self, sticky_seconds: float):
+        self.sticky_seconds = sticky_seconds
+        self._recent_writers.resize(self._recent_writers.max_size, sticky_seconds)
+
+    def mark_write(self, user_id: int):
+        self._recent_writers.set(user_id, True)
+        self.last_write = time.monotonic()
+
+    def replica_for(self, user_id: Optional[int] = None):
+        # ? None means: read from the primary
+        if not self.replicas or (user_id is not None and self._recent_writers.get(user_id)):
+            self.primary_reads += 1
+            return None
+
+        self.replica_reads += 1
+        return next(self._turn)
+
+    def replicas_may_lag(self) -> bool:
+        return time.monotonic() - self.last_write < self.sticky_seconds
+
+    def snapshot(self) -> dict:
+        return {"replicas": len(self.replicas), "replica_reads": self.replica_reads, "primary_reads": self.primary_reads}
+
+
+replica_router = ReplicaRouter([], defaults.replica_sticky_seconds)
+
+def configure(app_settings: Settings):
+    replica_router.set_sticky_seconds(app_settings.replica_sticky_seconds)
+
+
+def init_engines(app_settings: Settings = settings):
+    global async_engine, AsyncSessionLocal
+    if async_engine is not None:
+        return
+
+    async_engine = create_api_engine(async_database_url(database_url(app_settings)), app_settings)
+    # ! expire_on_commit=False: expired attributes would need IO when the response is serialized
+    AsyncSessionLocal = sessionmaker(
+        async_engine, class_=AsyncSession, autocommit=False, autoflush=False, expire_on_commit=False)
+    if app_settings.database_replica_urls:
+        replica_router.set_replicas(
+            [create_api_engine(async_database_url(url), app_settings) for url in app_settings.database_replica_urls])
+
+async def dispose_engines():
+    global engine, SessionLocal, async_engine, AsyncSessionLocal
+    for api_engine in ([async_engine] if async_engine else []) + replica_router.replicas:
+        await api_engine.dispose()
+    if engine is not None:
+        engine.dispose()
+
+    engine = SessionLocal = async_engine = AsyncSessionLocal = None
+    replica_router.set_replicas([])
+
+def async_session(**options) -> AsyncSession:
+    if AsyncSessionLocal is None:
+        init_engines()
+    return AsyncSessionLocal(**options)
+
+def sync_session() -> Session:
+    global engine, SessionLocal
+    if SessionLocal is None:
+        engine = create_engine(database_url(), **pool_options())
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return SessionLocal()
+
+
+async def read_db(db: AsyncSession, user_id: Optional[int] = None):
+    # ? the primary path reuses the request's own session (the one from get_db)
+    replica = replica_router.replica_for(user_id)
+    if replica is None:
+        yield db
+        return
+
+    replica_db = async_session(bind=replica, info={"replica": True})
+    try:
+        yield replica_db
+    finally:
+        await replica_db.close()
+
+# Dependency - GET /users/{id}: reads of a user stick to the primary after that user's writes (including
+# the signup itself), whoever asks (see oauth2.get_read_db for reads keyed on the current user)
+async def get_user_read_db(id: int, db: AsyncSession = Depends(get_db)):
+    async for session in read_db(db, id):
+        yield session
+
+def cacheable(db: AsyncSession) -> bool:
+    # ! a replica that is still replaying a recent write would put stale data back in the shared response cache
+    return not db.info.get("replica") or not replica_router.replicas_may_lag()
+
+# import psycopg2
+# from psycopg2.extras import RealDictCursor
+# import time
 
 # while True:
 #     try:
@@ -1,39 +1,89 @@
-import click
-from fastapi import FastAPI
+from typing import Optional
+
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from . import models
-from .database import engine
-from .routers import post, user, auth, vote
-from .config import settings
+from . import cache, counters, database, models, oauth2, utils
+from .counters import vote_counter
+from .middleware import QueryTimingMiddleware
+from .routers import post, user, auth, vote, metrics
+from .config import Settings, settings
 
 
-click.clear() # fix color codes on terminal
+# click.clear() # fix color codes on terminal   # ! old - cleared the terminal on every import (and cost a click import)
 
 # models.Base.metadata.create_all(bind=engine) # ! no more need for this command because we implemented Alembic
 
-app = FastAPI()
-
-origins = ["*"]
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# ? importing this module reads no settings and builds nothing: `app` is created on first access
+# ? (`uvicorn app.main:app`, `from app.main import app`), and engines, pools and the slow imports
+# ? (jose, passlib) are set up by its startup hook - `import app.main` stays cheap for workers, scripts and tests
 
-# ! routing magic !!!!
-app.include_router(post.router)
-app.include_router(user.router)
-app.include_router(auth.router)
-app.include_router(vote.router)
+async def password_hasher_busy(request: Request, exc: utils.PasswordHasherBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many login/signup requests, try again later"},
+        headers={"Retry-After": "1"})
 
-@app.get("/")
 def root():
     return {"message": "Hello World! Welcome to my API!"}
 
 
+def create_app(app_settings: Optional[Settings] = None) -> FastAPI:
+    # ! the settings are process wide: every `settings` read and the module level singletons follow the
+    # ! app_settings of the last app created, so run one app per process (as uvicorn workers do)
+    if app_settings is None:
+        app_settings = settings.get()
+    settings.configure(app_settings)
+    cache.configure(app_settings)
+    counters.configure(app_settings)
+    database.configure(app_settings)
+    oauth2.configure(app_settings)
+    utils.configure(app_settings)
+
+    app = FastAPI(default_response_class=ORJSONResponse) # ! orjson instead of the stdlib json for every response
+
+    origins = ["*"]
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    if app_settings.sql_instrumentation:
+        app.add_middleware(QueryTimingMiddleware)
+
+    # ! routing magic !!!!
+    app.include_router(post.router)
+    app.include_router(user.router)
+    app.include_router(auth.router)
+    app.include_router(vote.router)
+    app.include_router(metrics.router)
+
+    app.add_exception_handler(utils.PasswordHasherBusy, password_hasher_busy)
+
+    @app.on_event("startup")
+    async def startup():
+        database.init_engines(app_settings)
+        # ! pay the lazy imports here rather than on the first request
+        oauth2.jwt_backend()
+        utils.get_pwd_context()
+        vote_counter.start(database.async_session, app_settings.vote_flush_seconds)
+
+    @app.on_event("shutdown")
+    async def shutdown():
+        await vote_counter.stop(database.async_session)
+        await database.dispose_engines()
+
+    app.get("/")(root)
+    return app
 
 
+def __getattr__(name: str):
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,136 @@
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+import orjson
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from .config import settings
+
+
+logger = logging.getLogger("app.sql")
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.connections_opened = 0
+        self.checkouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.connect_time = 0.0
+
+    def attach(self, engine):
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.connections_opened += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts += 1
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        self.in_use -= 1
+
+    def record_wait(self, seconds: float):
+        self.waits += 1
+        self.wait_time += seconds
+
+    def record_connect(self, seconds: float):
+        self.connect_time += seconds
+
+    def snapshot(self) -> dict:
+        return {
+            "connections_opened": self.connections_opened,
+            "checkouts": self.checkouts,
+            "in_use": self.in_use,
+            "peak_in_use": self.peak_in_use,
+            "waits": self.waits,
+            "wait_time_ms": round(self.wait_time * 1000, 3),
+            "connect_time_ms": round(self.connect_time * 1000, 3),
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    # ? pool events fire only once a connection is handed out, so the checkout itself is timed here:
+    # ? it waits when the pool is full (queues up to pool_timeout), and only connects when there is spare capacity
+    def connect(self):
+        if self.checkedin():
+            return super().connect()
+
+        full = self._max_overflow > -1 and self.checkedout() >= self.size() + self._max_overflow
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            if full:
+                pool_metrics.record_wait(time.perf_counter() - start)
+            else:
+                pool_metrics.record_connect(time.perf_counter() - start)
+
+
+class RequestQueries:
+    # ? SQL statements run on behalf of one request, collected by the QueryTimer hooks
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest: Optional[str] = None
+
+    def record(self, statement: str, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms >= self.slowest_ms:
+            self.slowest_ms = elapsed_ms
+            self.slowest = statement
+
+
+current_queries: ContextVar[Optional[RequestQueries]] = ContextVar("current_queries", default=None)
+
+
+class QueryTimer:
+    # ? times every statement of an engine; async engines run these hooks in the request's context,
+    # ? so current_queries points at the RequestQueries of the request that ran the statement
+    def attach(self, engine):
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+
+    def detach(self, engine):
+        event.remove(engine, "before_cursor_execute", self._before)
+        event.remove(engine, "after_cursor_execute", self._after)
+
+    # ! the start time lives on the execution context, not conn.info: after_cursor_execute doesn't fire for a
+    # ! failed statement, and anything left on conn.info would stay with the pooled connection for its lifetime
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_start_time = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_query_start_time", None)
+        if start is None: # ! statements run outside an execution context (e.g. sequence pre-fetches) aren't timed
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        queries = current_queries.get()
+        if queries is not None:
+            queries.record(statement, elapsed_ms)
+
+        if elapsed_ms >= settings.slow_query_ms:
+            logger.warning(orjson.dumps({
+                "event": "slow_query", "duration_ms": round(elapsed_ms, 3), "statement": statement}).decode())
+
+
+query_timer = QueryTimer()
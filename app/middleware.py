@@ -0,0 +1,58 @@
+import logging
+import time
+
+import orjson
+from starlette.datastructures import MutableHeaders
+
+from .metrics import RequestQueries, current_queries
+
+
+logger = logging.getLogger("app.requests")
+
+
+class QueryTimingMiddleware:
+    # ? plain ASGI middleware (no BaseHTTPMiddleware): streamed responses pass through untouched
+    # ! Server-Timing goes out with the response headers, so for a streamed body it only covers the
+    # ! statements run before the first chunk - the log line, written at the end, covers all of them
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        queries = RequestQueries()
+        token = current_queries.set(queries)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message).append("Server-Timing", server_timing(queries, start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_queries.reset(token)
+            logger.info(orjson.dumps({
+                "event": "request",
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                "db_statements": queries.count,
+                "db_ms": round(queries.total_ms, 3),
+                "db_slowest_ms": round(queries.slowest_ms, 3),
+                "db_slowest": queries.slowest,
+            }).decode())
+
+
+def server_timing(queries: RequestQueries, start: float) -> str:
+    return ", ".join([
+        f'db;desc="{queries.count} statements";dur={queries.total_ms:.3f}',
+        f"db-slowest;dur={queries.slowest_ms:.3f}",
+        f"app;dur={(time.perf_counter() - start) * 1000:.3f}",
+    ])
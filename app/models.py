@@ -1,6 +1,7 @@
-from sqlalchemy import TIMESTAMP, Column, ForeignKey, Integer, String, Boolean, text
+from sqlalchemy import TIMESTAMP, Column, Computed, Float, ForeignKey, Index, Integer, String, Boolean, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from .database import Base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 
 class Post(Base):
     __tablename__ = "posts"
@@ -10,9 +11,23 @@ class Post(Base):
     content = Column(String, nullable=False)
     published = Column(Boolean, server_default='TRUE', nullable=False)
     created_at = Column(TIMESTAMP(timezone=True), server_default=text('now()'), nullable=False)
-    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True) # ! owner filter + cascade from users
+    vote_count = Column(Integer, server_default='0', nullable=False) # ! denormalized count(votes), kept in step by the vote router
+    # ? reddit style "hot": votes count in orders of magnitude, and 12.5 hours of age weigh as much as 10x the votes;
+    # ? newer posts simply start higher, so the score never needs a periodic re-decay - postgres recomputes it on vote
+    hot_score = Column(Float, Computed(
+        "log(greatest(vote_count, 1)) + extract(epoch from created_at - to_timestamp(0)) / 45000", persisted=True))
+    search_vector = deferred(Column( # ! generated by postgres, deferred so the feed doesn't load it
+        TSVECTOR, Computed("to_tsvector('english', title || ' ' || content)", persisted=True)))
 
-    owner = relationship("User")
+    owner = relationship("User", lazy="raise") # ! load it explicitly (joinedload), a lazy load per post is an N+1
+
+    __table_args__ = (
+        Index("ix_posts_created_at_id", "created_at", "id"), # ! backs the keyset (cursor) pagination of the feed
+        Index("ix_posts_search_vector", "search_vector", postgresql_using="gin"), # ! backs the full-text search
+        Index("ix_posts_hot_score_id", "hot_score", "id"), # ! sort=hot
+        Index("ix_posts_vote_count_id", "vote_count", "id"), # ! sort=top
+    )
 
 class User(Base):
     __tablename__ = "users"
@@ -27,5 +42,5 @@ class Vote(Base):
     __tablename__ = "votes"
 
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
-    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True, index=True) # ! the pk leads with user_id
     
\ No newline at end of file
@@ -1,52 +1,147 @@
-from jose import JWTError, jwt
+import hashlib
+import time
 from datetime import datetime, timedelta
+from functools import lru_cache
 from fastapi import Depends, status, HTTPException
 from fastapi.security import OAuth2PasswordBearer
+from typing import Optional
 from . import schemas, database, models
-from .config import settings
-from sqlalchemy.orm import Session
+from .cache import TTLCache
+from .config import Settings, defaults, settings
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 # ? https://fastapi.tiangolo.com/tutorial/security/oauth2-jwt/#:~:text=And%20another%20one%20to%20authenticate%20and%20return%20a%20user.
 
 
-SECRET_KEY = settings.secret_key
-ALGORITHM = settings.algorithm
-ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
+# SECRET_KEY = settings.secret_key   # ! old - read from settings when a token is signed/verified
+# ALGORITHM = settings.algorithm
+# ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
+
+# ? users rows keyed by id, so hot users don't cost a query on every request
+user_cache = TTLCache(defaults.user_cache_max_size, defaults.user_cache_ttl_seconds)
+
+# ? verified tokens keyed by their sha256 (the raw bearer tokens aren't kept in memory): the same token comes
+# ? back on every request of a session, and checking its signature again each time is most of the auth cost
+token_cache = TTLCache(defaults.token_cache_max_size, defaults.token_cache_ttl_seconds)
+
+ASYMMETRIC_ALGORITHMS = ("RS", "PS", "ES", "EdDSA")
+
+
+class JWTBackend:
+    # ? python-jose or PyJWT behind the same calls, with the keys for `algorithm` parsed once
+    def __init__(self, name: str, algorithm: str, secret_key: str,
+                 private_key: Optional[str] = None, public_key: Optional[str] = None):
+        if name == "pyjwt":
+            import jwt # ! optional dependency, only needed for this backend
+            self._jwt, self.error = jwt, jwt.PyJWTError
+        elif name == "jose":
+            # ! imported on first use, jose loads its cryptography backend (~60ms) at import time
+            from jose import JWTError, jwt
+            if algorithm == "EdDSA":
+                raise ValueError("python-jose doesn't support EdDSA, set jwt_backend=pyjwt")
+            self._jwt, self.error = jwt, JWTError
+        else:
+            raise ValueError(f"unknown jwt_backend: {name}")
+
+        self.name = name
+        self.algorithm = algorithm
+        if not algorithm.startswith(ASYMMETRIC_ALGORITHMS):
+            self.signing_key = self.verification_key = secret_key
+            return
+
+        from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
+        if not (private_key or public_key):
+            raise ValueError(f"{algorithm} needs jwt_private_key and/or jwt_public_key")
+        # ! key objects: passing PEM would parse (and for RSA, validate) the key again on every call
+        self.signing_key = load_pem_private_key(private_key.encode(), password=None) if private_key else None
+        self.verification_key = load_pem_public_key(public_key.encode()) if public_key else self.signing_key.public_key()
+        if name == "jose" and algorithm.startswith(("RS", "PS")):
+            self.signing_key = private_key # ! jose only takes RSA public keys as objects
+
+    def encode(self, claims: dict) -> str:
+        return self._jwt.encode(claims, self.signing_key, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        return self._jwt.decode(token, self.verification_key, algorithms=[self.algorithm])
+
+
+@lru_cache()
+def jwt_backend() -> JWTBackend:
+    return JWTBackend(settings.jwt_backend, settings.algorithm, settings.secret_key,
+                      settings.jwt_private_key, settings.jwt_public_key)
+
+def configure(app_settings: Settings):
+    user_cache.resize(app_settings.user_cache_max_size, app_settings.user_cache_ttl_seconds)
+    token_cache.resize(app_settings.token_cache_max_size, app_settings.token_cache_ttl_seconds)
+    token_cache.clear() # ! verified under the previous key/algorithm
+    jwt_backend.cache_clear()
 
 def create_access_token(data: dict):
     to_encode = data.copy()
     
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    expire = datetime.utcnow() + timedelta(minutes=settings.access_token_expire_minutes)
     to_encode.update({"exp": expire})
 
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt_backend().encode(to_encode)
 
     return encoded_jwt
 
 
 def verify_access_token(token: str, credentials_exception):
+    cache_key = hashlib.sha256(token.encode()).digest()
+    token_data = token_cache.get(cache_key)
+    if token_data is not None:
+        return token_data
 
+    backend = jwt_backend()
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = backend.decode(token)
         id: str = payload.get("user_id")
         if id is None:
             raise credentials_exception
         token_data = schemas.TokenData(id=id)
-    except JWTError:
+    except backend.error:
         raise credentials_exception
 
+    # ! only valid tokens are cached, and only until they expire
+    ttl = settings.token_cache_ttl_seconds
+    if payload.get("exp") is not None:
+        ttl = min(ttl, payload["exp"] - time.time())
+    if ttl > 0:
+        token_cache.set(cache_key, token_data, ttl)
+
     return token_data
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+class CurrentUser:
+    # ? principal built from the token claims - the users row is only loaded when a handler asks for it
+    def __init__(self, id: int, db: AsyncSession):
+        self.id = id
+        self._db = db
+
+    async def load(self) -> Optional[models.User]:
+        user = user_cache.get(self.id)
+        if user is None:
+            # ! a plain (immutable) row, so it can be shared between requests
+            user = (await self._db.execute(
+                select(models.User.__table__).where(models.User.id == self.id))).first()
+            if user is not None:
+                user_cache.set(self.id, user)
+        return user
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_db)):
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
 
     token = verify_access_token(token, credentials_exception)
-    user = db.query(models.User).filter(models.User.id == token.id).first()
+    # user = db.query(models.User).filter(models.User.id == token.id).first()   # ! old - one query per authenticated request
     
-    return user
-
-
+    return CurrentUser(int(token.id), db)
 
 
+# Dependency - read-only handlers: a replica session, unless the current user wrote recently
+async def get_read_db(current_user: CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(database.get_db)):
+    async for session in database.read_db(db, current_user.id):
+        yield session
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, status, HTTPException, Response
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import database, schemas, models, utils, oauth2
 
@@ -12,15 +13,16 @@ router = APIRouter(
 
 # @router.post("/login", response_model=schemas.Token)
 @router.post("/login")
-def login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
+async def login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_db)):
     
-    user = db.query(models.User).filter(models.User.email == user_credentials.username).first()
+    user = (await db.execute(
+        select(models.User).where(models.User.email == user_credentials.username))).scalars().first()
     
     if not user:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Invalid credentials")
 
-    if not utils.verify(user_credentials.password, user.password):
+    if not await utils.verify_async(user_credentials.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Invalid credentials")
 
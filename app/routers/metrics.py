@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends
+
+from .. import oauth2
+
+from ..cache import response_cache
+from ..counters import vote_counter
+from ..database import replica_router
+from ..metrics import pool_metrics
+from ..utils import password_hasher
+
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=['Metrics']
+)
+
+@router.get("/")
+# ! pool, replica and cache internals are not public
+async def get_metrics(current_user: dict = Depends(oauth2.get_current_user)):
+    return {
+        "pool": pool_metrics.snapshot(),
+        "password_hasher": password_hasher.snapshot(),
+        "response_cache": response_cache.snapshot(),
+        "replicas": replica_router.snapshot(),
+        "vote_counter": vote_counter.snapshot(),
+    }
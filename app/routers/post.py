@@ -1,10 +1,14 @@
-from click import get_current_context
-from fastapi import Body, FastAPI, Response, status, HTTPException, Depends, APIRouter
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi import Header, Response, status, HTTPException, Depends, APIRouter
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy import delete, func, insert, literal_column, select, tuple_, update
 from typing import List, Optional
-from .. import models, schemas, oauth2
-from ..database import get_db
+from .. import models, schemas, oauth2, serializers, utils
+from ..cache import response_cache
+from ..config import settings
+from ..counters import vote_counter
+from ..database import cacheable, get_db, replica_router
 
 
 
@@ -13,11 +17,19 @@ router = APIRouter(
     tags=['Posts']
 )
 
+# ? sort=hot|top|new: each reads the feed straight off a (column, id) index, no aggregate and sort
+SORT_COLUMNS = {
+    schemas.PostSort.hot: models.Post.hot_score,
+    schemas.PostSort.top: models.Post.vote_count,
+    schemas.PostSort.new: models.Post.created_at,
+}
+
 @router.get("/", response_model=List[schemas.PostOut])
-def get_posts(
-    db: Session = Depends(get_db), 
+async def get_posts(
+    db: AsyncSession = Depends(oauth2.get_read_db), 
     current_user: dict = Depends(oauth2.get_current_user),
-    limit: int = 10, skip: int = 0, search: Optional[str] = ""): # ! query parameters
+    limit: int = 10, skip: int = 0, search: Optional[str] = "",
+    cursor: Optional[str] = None, sort: Optional[schemas.PostSort] = None): # ! query parameters
     
     # ? (old) regular SQL method for database query
     # cursor.execute(""" SELECT * FROM posts """)
@@ -30,17 +42,103 @@ def get_posts(
     # posts = db.query(models.Post).filter(         # ! old 'posts' - not using joins
     #     models.Post.title.contains(search)).limit(limit).offset(skip).all() 
 
-    posts = db.query(models.Post, func.count(models.Vote.post_id).label("votes")).join(
-        models.Vote, 
-        models.Vote.post_id == models.Post.id,
-        isouter=True).group_by(models.Post.id).filter(
-            models.Post.title.contains(search)).limit(limit).offset(skip).all()
+    # posts = db.query(models.Post, models.Post.vote_count.label("votes")).filter(    # ! old search - LIKE '%search%' can't use an index
+    #     models.Post.title.contains(search)).limit(limit).offset(skip).all()
+
+    if cursor:
+        # ! validated before the cache lookup: an invalid cursor is a 400, whatever is cached
+        try:
+            last_value, last_id = utils.decode_cursor(cursor, (sort or schemas.PostSort.new).value)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, 
+                detail="Invalid cursor")
+
+    cache_key = await response_cache.feed_key(
+        limit=limit, skip=skip, search=search, cursor=cursor, sort=sort and sort.value)
+    cached = await response_cache.get(cache_key)
+    if cached:
+        return cached
+
+    # ? the owners come in the same statement (LEFT OUTER JOIN users), not one query per post
+    posts_query = select(models.Post, models.Post.vote_count.label("votes")).options(joinedload(models.Post.owner))
+
+    if search:
+        # ? full-text search over title + content through the GIN index on posts.search_vector
+        ts_query = func.websearch_to_tsquery(literal_column("'english'"), search) # ! inlined, asyncpg would bind it as varchar
+        posts_query = posts_query.where(models.Post.search_vector.op("@@")(ts_query))
+
+    if cursor is None:
+        # ! offset pagination, kept for backward compatibility (cost grows with skip)
+        if sort:
+            posts_query = posts_query.order_by(SORT_COLUMNS[sort].desc(), models.Post.id.desc())
+        elif search:
+            posts_query = posts_query.order_by(
+                func.ts_rank(models.Post.search_vector, ts_query).desc(), models.Post.id)
+
+        posts = (await db.execute(posts_query.limit(limit).offset(skip))).all()
+        next_cursor = None
+
+    else:
+        # ? keyset pagination: pass `cursor=` (empty) for the first page, then the X-Next-Cursor header
+        sort = sort or schemas.PostSort.new
+        sort_column = SORT_COLUMNS[sort]
+        posts_query = posts_query.order_by(sort_column.desc(), models.Post.id.desc())
+
+        if cursor:
+            posts_query = posts_query.where(
+                tuple_(sort_column, models.Post.id) < tuple_(last_value, last_id))
+
+        rows = (await db.execute(posts_query.limit(limit + 1))).all() # ! one extra row tells us whether there is a next page
+        posts = rows[:limit]
+        next_cursor = None
+
+        if posts and len(rows) > len(posts):
+            last_post = posts[-1].Post
+            next_cursor = utils.encode_cursor(getattr(last_post, sort_column.key), last_post.id, sort.value)
+
+    response = Response(serializers.dumps([serializers.post_out(post) for post in posts]), media_type="application/json")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    if cacheable(db):
+        await response_cache.set(cache_key, response)
+
+    return response
+
+# ! must be registered before /{id}, otherwise "export" is matched as a post id
+@router.get("/export")
+async def export_posts(
+    db: AsyncSession = Depends(oauth2.get_read_db), 
+    current_user: dict = Depends(oauth2.get_current_user),
+    search: Optional[str] = "", owner_id: Optional[schemas.Id] = None):
+
+    # ? plain columns instead of ORM entities: nothing piles up in the session's identity map while streaming
+    export_query = select(
+        models.Post.id, models.Post.title, models.Post.content, models.Post.published, models.Post.created_at,
+        models.Post.owner_id, models.Post.vote_count.label("votes"),
+        models.User.email.label("owner_email"), models.User.created_at.label("owner_created_at")).join(
+            models.User, models.Post.owner_id == models.User.id).order_by(models.Post.id)
+
+    if search:
+        ts_query = func.websearch_to_tsquery(literal_column("'english'"), search)
+        export_query = export_query.where(models.Post.search_vector.op("@@")(ts_query))
+    if owner_id is not None:
+        export_query = export_query.where(models.Post.owner_id == owner_id)
 
-    return posts
+    # ? server-side cursor: rows arrive in chunks of export_batch_size, memory stays flat whatever the table size
+    result = await db.stream(export_query.execution_options(
+        stream_results=True, max_row_buffer=settings.export_batch_size))
+
+    async def ndjson_lines():
+        async for rows in result.partitions(settings.export_batch_size):
+            yield b"".join(serializers.dumps(serializers.export_row(row)) + b"\n" for row in rows)
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
 
 # everytime we create something we should return a 201 status code
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.Post)
-def create_posts(post: schemas.PostCreate, db: Session = Depends(get_db), current_user: dict = Depends(oauth2.get_current_user)):
+async def create_posts(post: schemas.PostCreate, db: AsyncSession = Depends(get_db), current_user: dict = Depends(oauth2.get_current_user)):
     
     # ? (old) regular SQL method for database query
     # cursor.execute("""
@@ -58,26 +156,85 @@ def create_posts(post: schemas.PostCreate, db: Session = Depends(get_db), curren
     new_post = models.Post(owner_id=current_user.id, **post.dict()) # ! unpacking dict (more efficient than above method)
         
     db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
+    await db.commit()
+    replica_router.mark_write(current_user.id)
+    # ! one select for the generated columns and the owner, instead of a refresh plus an owner query
+    new_post = (await db.execute(
+        select(models.Post).options(joinedload(models.Post.owner)).where(
+            models.Post.id == new_post.id).execution_options(populate_existing=True))).scalars().one()
+    await response_cache.invalidate_feed()
 
     return new_post
 
+# ! asyncpg allows at most 32767 bind parameters per statement, 4 per post
+BULK_INSERT_CHUNK_SIZE = 5000
+
+@router.post("/bulk", status_code=status.HTTP_201_CREATED, response_model=List[schemas.Post],
+             dependencies=[Depends(utils.max_body_items("post_bulk_max_size", "posts"))])
+async def create_posts_bulk(posts: List[schemas.PostCreate], db: AsyncSession = Depends(get_db), current_user: dict = Depends(oauth2.get_current_user)):
+
+    # ? every item is validated by the List[schemas.PostCreate] body, errors point at ["body", <index>, <field>]
+    # ? the size limit is checked by max_body_items before that validation runs
+
+    owner = await current_user.load()
+    if owner is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+
+    # ? multi-row INSERT ... RETURNING: one round trip per chunk instead of add + commit + refresh per post
+    new_posts = []
+    for start in range(0, len(posts), BULK_INSERT_CHUNK_SIZE):
+        chunk = posts[start:start + BULK_INSERT_CHUNK_SIZE]
+        new_posts += (await db.execute(
+            insert(models.Post).values([{"owner_id": owner.id, **post.dict()} for post in chunk]).returning(
+                models.Post.title, models.Post.content, models.Post.published, models.Post.id,
+                models.Post.created_at, models.Post.owner_id))).all()
+    await db.commit()
+    replica_router.mark_write(current_user.id)
+
+    if new_posts:
+        await response_cache.invalidate_feed()
+
+    return Response(
+        serializers.dumps([serializers.post(post, owner) for post in new_posts]), 
+        status_code=status.HTTP_201_CREATED, media_type="application/json")
+
 # in order to get a specific post we should pass a path parameter
 @router.get("/{id}", response_model=schemas.PostOut)
-def get_post(id: int, db: Session = Depends(get_db), current_user: dict = Depends(oauth2.get_current_user)):
+async def get_post(
+    id: schemas.Id, db: AsyncSession = Depends(oauth2.get_read_db), 
+    current_user: dict = Depends(oauth2.get_current_user),
+    if_none_match: Optional[str] = Header(None)):
     # ? (old) regular SQL method for database query
     # cursor.execute(""" SELECT * FROM posts WHERE id = %s """, (str(id)))
     # post = cursor.fetchone()
     
     # ? using ORM for database query
 
+    cache_key = await response_cache.post_key(id)
+    cached = await response_cache.get(cache_key)
+    if cached:
+        if utils.etag_matches(if_none_match, cached.headers.get("etag")):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": cached.headers["etag"]})
+        return cached
+
+    if if_none_match:
+        # ? cheap version probe (primary key lookup, no join, nothing to serialize) before loading the row
+        version = (await db.execute(
+            select(literal_column("xmin")).select_from(models.Post).where(models.Post.id == id))).scalar()
+        etag = utils.make_etag(id, vote_counter.version(id, version))
+        if version is not None and utils.etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
     # post = db.query(models.Post).filter(models.Post.id == id).first()     # ! old 'post' - not using joins
 
-    post = db.query(models.Post, func.count(models.Vote.post_id).label("votes")).join(
-        models.Vote, 
-        models.Vote.post_id == models.Post.id,
-        isouter=True).group_by(models.Post.id).filter(models.Post.id == id).first()
+    # post = db.query(models.Post, func.count(models.Vote.post_id).label("votes")).join(      # ! old 'post' - counting votes on every read
+    #     models.Vote, 
+    #     models.Vote.post_id == models.Post.id,
+    #     isouter=True).group_by(models.Post.id).filter(models.Post.id == id).first()
+
+    post = (await db.execute(
+        select(models.Post, models.Post.vote_count.label("votes"), literal_column("posts.xmin").label("version")).options(
+            joinedload(models.Post.owner)).where(models.Post.id == id))).first()
 
     if not post:
         raise HTTPException(
@@ -88,35 +245,49 @@ def get_post(id: int, db: Session = Depends(get_db), current_user: dict = Depend
     #     raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to perform requested action")
 
         
-    return post
+    response = Response(
+        serializers.dumps(serializers.post_out(post)), media_type="application/json",
+        headers={"ETag": utils.make_etag(id, vote_counter.version(id, post.version))})
+    if cacheable(db):
+        await response_cache.set(cache_key, response)
+
+    return response
+
+async def owner_probe(db: AsyncSession, id: int) -> HTTPException:
+    # ? only runs when a guarded UPDATE/DELETE matched no row: tells a missing post (404) from someone else's (403)
+    owner_id = (await db.execute(select(models.Post.owner_id).where(models.Post.id == id))).scalar()
+    if owner_id is None:
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, 
+            detail=f"post with id: {id} does not exist")
+    return HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to perform requested action")
 
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_post(id: int, db: Session = Depends(get_db), current_user: dict = Depends(oauth2.get_current_user)):
+async def delete_post(id: schemas.Id, db: AsyncSession = Depends(get_db), current_user: dict = Depends(oauth2.get_current_user)):
     # ? (old) regular SQL method for database query
     # cursor.execute(""" DELETE FROM posts WHERE id = %s RETURNING * """, (str(id)))
     # deleted_post = cursor.fetchone()
     # conn.commit()
 
     # ? using ORM for database query
-    post_query = db.query(models.Post).filter(models.Post.id == id)
+    # post = (await db.execute(select(models.Post).where(models.Post.id == id))).scalars().first()   # ! old - select, then delete
 
-    post = post_query.first()
+    # ? the ownership check is part of the WHERE clause, so the common case is a single statement
+    deleted = (await db.execute(
+        delete(models.Post).where(models.Post.id == id, models.Post.owner_id == current_user.id).returning(
+            models.Post.id).execution_options(synchronize_session=False))).first()
 
-    if post == None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, 
-            detail=f"post with id: {id} does not exist")
+    if deleted is None:
+        raise await owner_probe(db, id)
 
-    if post.owner_id != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to perform requested action")
-            
-    post_query.delete(synchronize_session=False)
-    db.commit()
+    await db.commit()
+    replica_router.mark_write(current_user.id)
+    await response_cache.invalidate_posts(id)
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @router.put("/{id}", response_model=schemas.Post)
-def update_post(id: int, updated_post: schemas.PostCreate, db: Session = Depends(get_db), current_user: dict = Depends(oauth2.get_current_user)):
+async def update_post(id: schemas.Id, updated_post: schemas.PostCreate, db: AsyncSession = Depends(get_db), current_user: dict = Depends(oauth2.get_current_user)):
 
     # ? (old) regular SQL method for database query
     # cursor.execute(""" UPDATE posts 
@@ -127,24 +298,25 @@ def update_post(id: int, updated_post: schemas.PostCreate, db: Session = Depends
     # conn.commit()
 
     # ? using ORM for database query
-    post_query = db.query(models.Post).filter(models.Post.id == id)
-    post = post_query.first()
-
-    if post == None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, 
-            detail=f"post with id: {id} does not exist")
-
-    if post.owner_id != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to perform requested action")
-
+    # post = (await db.execute(select(models.Post.owner_id).where(models.Post.id == id))).first()   # ! old - select, update, select again
 
     # post_query.update({
     #     'title': 'hey this is my updated title',
     #     'content': 'this is my updated content'}, synchronize_session=False) # ! not optimal solution
 
-    post_query.update(updated_post.dict(), synchronize_session=False) # ! best solution
-    
-    db.commit()
+    # ? UPDATE ... WHERE id AND owner_id RETURNING: check, write and read back in one round trip
+    post = (await db.execute(
+        update(models.Post).where(models.Post.id == id, models.Post.owner_id == current_user.id).values(
+            **updated_post.dict()).returning(
+                models.Post.title, models.Post.content, models.Post.published, models.Post.id,
+                models.Post.created_at, models.Post.owner_id).execution_options(synchronize_session=False))).first()
+
+    if post is None:
+        raise await owner_probe(db, id)
+
+    await db.commit()
+    replica_router.mark_write(current_user.id)
+    await response_cache.invalidate_posts(id)
 
-    return post_query.first()
\ No newline at end of file
+    owner = await current_user.load() # ! the owner is the current user, served from the user cache
+    return Response(serializers.dumps(serializers.post(post, owner)), media_type="application/json")
@@ -1,7 +1,10 @@
-from fastapi import Body, FastAPI, Response, status, HTTPException, Depends, APIRouter
+from fastapi import Header, Response, status, HTTPException, Depends, APIRouter
+from sqlalchemy import literal_column, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 from .. import models, schemas, utils
-from sqlalchemy.orm import Session
-from ..database import get_db
+from ..database import get_db, get_user_read_db, replica_router
 
 
 
@@ -11,32 +14,53 @@ router = APIRouter(
 )
 
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.UserOut)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
 
-    #  hash the password - user.password
-    hashed_password = utils.hash(user.password)
-    user.password = hashed_password
-
-    user_db = db.query(models.User).filter(models.User.email == user.email).first()
+    # ! check for duplicates before hashing, so a duplicate signup doesn't cost a bcrypt round
+    user_db = (await db.execute(select(models.User.id).where(models.User.email == user.email))).first()
     if user_db:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail=f"User already exists"
         )
 
-    new_user = models.User(**user.dict())
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    #  hash the password - user.password (bcrypt is CPU bound, it runs on the bounded hashing pool)
+    hashed_password = await utils.hash_async(user.password)
+    user.password = hashed_password
+
+    # ? ON CONFLICT settles a concurrent signup for the same email that got past the check above
+    new_user = (await db.execute(
+        insert(models.User).values(**user.dict()).on_conflict_do_nothing(
+            index_elements=[models.User.email]).returning(
+                models.User.id, models.User.email, models.User.created_at))).first()
+    if new_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"User already exists"
+        )
+    await db.commit()
+    replica_router.mark_write(new_user.id) # ! the new user's row may not have reached the replicas yet
 
     return new_user
 
 @router.get('/{id}', response_model=schemas.UserOut)
-def get_user(id: int, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.id == id).first()
+async def get_user(id: schemas.Id, response: Response, db: AsyncSession = Depends(get_user_read_db), if_none_match: Optional[str] = Header(None)):
+
+    if if_none_match:
+        # ? cheap version probe before loading the row, see get_post
+        version = (await db.execute(
+            select(literal_column("xmin")).select_from(models.User).where(models.User.id == id))).scalar()
+        etag = utils.make_etag(id, version)
+        if version is not None and utils.etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    user = (await db.execute(
+        select(models.User, literal_column("users.xmin").label("version")).where(models.User.id == id))).first()
 
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
             detail=f"User with {id} does not exist")
-    return user
\ No newline at end of file
+
+    response.headers["ETag"] = utils.make_etag(id, user.version)
+    return user.User
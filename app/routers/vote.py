@@ -1,41 +1,120 @@
 from fastapi import APIRouter, Depends, status, HTTPException, Response
-from sqlalchemy.orm import Session
-from .. import schemas, database, models, oauth2
+from sqlalchemy import delete, literal, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+from .. import schemas, database, models, oauth2, utils
+from ..cache import response_cache
+from ..counters import vote_counter
 
 router = APIRouter(
     prefix="/vote",
     tags=['Vote']
 )
 
+def count_vote(vote_query, delta: int):
+    if vote_counter.enabled:
+        # ? buffered: only the vote row is written here, vote_counter carries the delta to posts at its next flush
+        return vote_query.returning(models.Vote.post_id)
+
+    # ? UPDATE posts ... FROM (INSERT/DELETE votes ... RETURNING post_id): the vote and the post counter in one statement
+    changed = vote_query.returning(models.Vote.post_id).cte("changed_vote")
+    return update(models.Post).where(models.Post.id == changed.c.post_id).values(
+        vote_count=models.Post.vote_count + delta).returning(models.Post.id).execution_options(
+            synchronize_session=False)
+
 @router.post("/", status_code=status.HTTP_201_CREATED)
-def vote(vote: schemas.Vote, db: Session = Depends(database.get_db), current_user: int = Depends(oauth2.get_current_user)):
+async def vote(vote: schemas.Vote, db: AsyncSession = Depends(database.get_db), current_user: int = Depends(oauth2.get_current_user)):
     
-    post = db.query(models.Post).filter(models.Post.id == vote.post_id).first()
-    if not post:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, 
-            detail=f"Post with id: {vote.post_id} does not exist")
-
-    vote_query = db.query(models.Vote).filter(
-        models.Vote.post_id == vote.post_id, models.Vote.user_id == current_user.id)
-    found_vote = vote_query.first()
+    # ! no read-before-write: the insert/delete result tells the cases apart, and the votes.post_id FK catches missing posts
 
     if (vote.dir == 1):
-        if found_vote:
+        vote_query = insert(models.Vote).values(
+            post_id=vote.post_id, user_id=current_user.id).on_conflict_do_nothing()
+        try:
+            voted = (await db.execute(count_vote(vote_query, 1))).first()
+        except IntegrityError:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, 
+                detail=f"Post with id: {vote.post_id} does not exist")
+        if not voted:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT, 
                 detail=f"user {current_user.id} has already voted on post {vote.post_id}")
-        new_vote = models.Vote(post_id=vote.post_id, user_id=current_user.id)
-        db.add(new_vote)
-        db.commit()
+        await db.commit()
+        vote_counter.add({vote.post_id: 1})
+        database.replica_router.mark_write(current_user.id)
+        await response_cache.invalidate_posts(vote.post_id)
 
         return {"message": "successfully added vote"}
     else:
-        if not found_vote:
+        vote_query = delete(models.Vote).where(
+            models.Vote.post_id == vote.post_id, models.Vote.user_id == current_user.id)
+        unvoted = (await db.execute(count_vote(vote_query, -1))).first()
+        if not unvoted:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, 
                 detail="Vote does not exist")
-        vote_query.delete(synchronize_session=False)
-        db.commit()
+        await db.commit()
+        vote_counter.add({vote.post_id: -1})
+        database.replica_router.mark_write(current_user.id)
+        await response_cache.invalidate_posts(vote.post_id)
+
+        return {"message": "successfully deleted vote"}
+
+@router.post("/batch", response_model=List[schemas.VoteResult],
+             dependencies=[Depends(utils.max_body_items("vote_batch_max_size", "votes"))])
+async def vote_batch(votes: List[schemas.Vote], db: AsyncSession = Depends(database.get_db), current_user: int = Depends(oauth2.get_current_user)):
+
+    post_ids = [vote.post_id for vote in votes]
+    if len(set(post_ids)) != len(post_ids):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, 
+            detail="a batch can hold only one vote per post")
+
+    # ? the whole batch is one multi-row insert and one delete, committed together
+    up_ids = [vote.post_id for vote in votes if vote.dir == 1]
+    down_ids = [vote.post_id for vote in votes if vote.dir != 1]
+    added, deleted, existing = set(), set(), set()
+
+    if up_ids:
+        # ! inserting from a select on posts skips missing posts instead of failing the batch on the FK
+        vote_query = insert(models.Vote).from_select(
+            ["user_id", "post_id"],
+            select(literal(current_user.id), models.Post.id).where(models.Post.id.in_(up_ids))).on_conflict_do_nothing()
+        added = set((await db.execute(count_vote(vote_query, 1))).scalars().all())
+
+        not_added = [post_id for post_id in up_ids if post_id not in added]
+        if not_added:
+            existing = set((await db.execute(
+                select(models.Post.id).where(models.Post.id.in_(not_added)))).scalars().all())
+
+    if down_ids:
+        vote_query = delete(models.Vote).where(
+            models.Vote.user_id == current_user.id, models.Vote.post_id.in_(down_ids))
+        deleted = set((await db.execute(count_vote(vote_query, -1))).scalars().all())
+
+    await db.commit()
+    vote_counter.add({**{post_id: 1 for post_id in added}, **{post_id: -1 for post_id in deleted}})
+    database.replica_router.mark_write(current_user.id)
+    if added or deleted:
+        await response_cache.invalidate_posts(*added, *deleted)
+
+    results = []
+    for vote in votes:
+        if vote.dir == 1 and vote.post_id in added:
+            result = (status.HTTP_201_CREATED, "successfully added vote")
+        elif vote.dir == 1 and vote.post_id in existing:
+            result = (status.HTTP_409_CONFLICT, f"user {current_user.id} has already voted on post {vote.post_id}")
+        elif vote.dir == 1:
+            result = (status.HTTP_404_NOT_FOUND, f"Post with id: {vote.post_id} does not exist")
+        elif vote.post_id in deleted:
+            result = (status.HTTP_201_CREATED, "successfully deleted vote")
+        else:
+            result = (status.HTTP_404_NOT_FOUND, "Vote does not exist")
+        results.append(schemas.VoteResult(
+            post_id=vote.post_id, dir=vote.dir, status_code=result[0], detail=result[1]))
 
-        return {"message": "successfully deleted vote"}
\ No newline at end of file
+    return results
@@ -1,9 +1,14 @@
 from pydantic import BaseModel, EmailStr, conint
 from datetime import datetime
+from enum import Enum
 from typing import Optional
 
 # body validation (using pydantic)
 
+# ! ids are postgres `integer` columns: asyncpg refuses to bind anything bigger (DataError, a 500)
+INT_MAX = 2**31 - 1
+Id = conint(ge=-INT_MAX - 1, le=INT_MAX)
+
 class UserOut(BaseModel):
     id: int
     email: EmailStr
@@ -23,6 +28,12 @@ class UserLogin(BaseModel):
     password: str
 
 
+class PostSort(str, Enum):
+    hot = "hot"
+    top = "top"
+    new = "new"
+
+
 class PostBase(BaseModel):
     title: str
     content: str
@@ -61,5 +72,12 @@ class TokenData(BaseModel):
 
 
 class Vote(BaseModel):
-    post_id: int
+    post_id: Id
     dir: conint(le=1)
+
+
+class VoteResult(BaseModel):
+    post_id: int
+    dir: int
+    status_code: int
+    detail: str
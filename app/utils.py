@@ -1,10 +1,142 @@
-from passlib.context import CryptContext
+import asyncio
+import base64
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Optional, Tuple
 
+from fastapi import HTTPException, Request, status
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from .config import Settings, defaults, settings
+from .schemas import INT_MAX
+
+
+# pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)   # ! old - built at import time
+
+@lru_cache()
+def get_pwd_context():
+    # ! passlib is imported on first use, it adds ~20ms to every cold start otherwise
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
 
 def hash(password: str):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def verify(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    # ? bcrypt releases the GIL, so a small dedicated thread pool hashes in parallel off the event loop
+    # ? and a bounded queue in front of it turns login bursts into 503s instead of starving other endpoints
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    def resize(self, workers: int, max_queue: int):
+        self.max_queue = max_queue
+        if workers != self.workers:
+            # ! hashes already submitted finish on the old pool
+            self._executor.shutdown(wait=False)
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+            self.workers = workers
+
+    async def run(self, fn, *args):
+        if self.in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def snapshot(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.in_flight - self.workers),
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+password_hasher = PasswordHasher(defaults.password_hash_workers, defaults.password_hash_max_queue)
+
+def configure(app_settings: Settings):
+    password_hasher.resize(app_settings.password_hash_workers, app_settings.password_hash_max_queue)
+    get_pwd_context.cache_clear() # ! bcrypt_rounds
+
+async def hash_async(password: str):
+    return await password_hasher.run(hash, password)
+
+async def verify_async(plain_password, hashed_password):
+    return await password_hasher.run(verify, plain_password, hashed_password)
+
+
+# ? opaque keyset cursor: base64 of the sort value and id of the last row of a page - sort=new cursors
+# ? are [created_at, id] (the original format), the others also name their sort so they can't be mixed up
+def encode_cursor(value, id: int, sort: str = "new") -> str:
+    raw = json.dumps([value.isoformat(), id] if sort == "new" else [value, id, sort]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def checked_id(value) -> int:
+    # ! cursor values are bound to `integer` columns (id, vote_count), see schemas.INT_MAX
+    value = int(value)
+    if not -INT_MAX - 1 <= value <= INT_MAX:
+        raise ValueError(f"{value} is out of the integer range")
+    return value
+
+def decode_cursor(cursor: str, sort: str = "new") -> Tuple[Any, int]:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        if sort == "new":
+            created_at, id = json.loads(base64.urlsafe_b64decode(padded))
+            return datetime.fromisoformat(created_at), checked_id(id)
+
+        value, id, cursor_sort = json.loads(base64.urlsafe_b64decode(padded))
+        if cursor_sort != sort:
+            raise ValueError(f"cursor of sort={cursor_sort}")
+        return (float(value) if sort == "hot" else checked_id(value)), checked_id(id)
+    except (TypeError, ValueError) as error:
+        raise ValueError(f"invalid cursor: {cursor!r}") from error
+
+
+# ? strong validators from the postgres row version: xmin is the id of the transaction that last wrote
+# ? the row, so any UPDATE (edits, and votes through posts.vote_count) gives a new etag
+def max_body_items(setting: str, noun: str):
+    # ! dependencies are solved before the body is validated, so an oversized list is refused
+    # ! without paying for per-item validation; the json is already parsed and cached on the request
+    async def check(request: Request):
+        body = await request.json()
+        limit = getattr(settings, setting)
+        if isinstance(body, list) and len(body) > limit:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"at most {limit} {noun} per request")
+    return check
+
+
+def make_etag(id: int, version) -> str:
+    return f'"{id}-{version}"'
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    # ! If-None-Match uses the weak comparison, so W/"..." still matches
+    tags = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
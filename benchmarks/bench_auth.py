@@ -0,0 +1,74 @@
+"""CPU cost of authenticating one request (verify_access_token) per JWT backend and algorithm.
+
+    python -m benchmarks.bench_auth
+    python -m benchmarks.bench_auth --configs jose:HS256,pyjwt:EdDSA
+
+No database needed. For every backend:algorithm pair it times signing a token, verifying it
+from scratch (what every request paid before the token cache), and verifying it again with
+the token cache warm (what a returning bearer token costs now). pyjwt needs the PyJWT package.
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime, timedelta
+
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from cryptography.hazmat.primitives.serialization import Encoding, NoEncryption, PrivateFormat
+
+from app import oauth2
+from app.cache import TTLCache
+from app.config import settings
+
+
+def private_key_pem(algorithm: str) -> str:
+    if algorithm.startswith("ES"):
+        key = ec.generate_private_key({"ES256": ec.SECP256R1(), "ES384": ec.SECP384R1()}[algorithm])
+    elif algorithm == "EdDSA":
+        key = ed25519.Ed25519PrivateKey.generate()
+    else:
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(Encoding.PEM, PrivateFormat.PKCS8, NoEncryption()).decode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", default="jose:HS256,jose:ES256,pyjwt:HS256,pyjwt:ES256,pyjwt:EdDSA")
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    results = {}
+    for config in args.configs.split(","):
+        name, algorithm = config.split(":")
+        private_key = private_key_pem(algorithm) if algorithm.startswith(oauth2.ASYMMETRIC_ALGORITHMS) else None
+        try:
+            backend = oauth2.JWTBackend(name, algorithm, settings.secret_key, private_key=private_key)
+        except ImportError as error:
+            print(f"{config:>14}: skipped ({error})")
+            continue
+
+        oauth2.jwt_backend = lambda: backend
+        token = backend.encode({"user_id": 1, "exp": datetime.utcnow() + timedelta(hours=1)})
+
+        def uncached():
+            oauth2.token_cache = TTLCache(1, 300) # ! a fresh cache, so the signature is checked every time
+            oauth2.verify_access_token(token, None)
+
+        oauth2.token_cache = TTLCache(1, 300)
+        paths = {
+            "sign": lambda: backend.encode({"user_id": 1, "exp": datetime.utcnow() + timedelta(hours=1)}),
+            "verify": uncached,
+            "verify (cached)": lambda: oauth2.verify_access_token(token, None),
+        }
+        results[config] = {}
+        for path, run in paths.items():
+            if path == "verify (cached)":
+                run() # ! fill the cache
+            seconds = min(timeit.repeat(run, number=args.number, repeat=5)) / args.number
+            results[config][path] = round(seconds * 1e6, 1)
+        print(f"{config:>14}: " + " | ".join(f"{path} {us:>8.1f} us" for path, us in results[config].items()))
+
+    print(json.dumps({"us_per_call": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Posts created per second: looping POST /posts/ vs POST /posts/bulk in batches.
+
+    python -m benchmarks.bench_bulk_create --posts 20000 --batch-sizes 100,1000,10000
+
+Both run against a real uvicorn process (pooled connections), one client, sequential requests.
+"""
+import argparse
+import json
+import time
+
+import requests
+
+from app.oauth2 import create_access_token
+from . import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=20_000)
+    parser.add_argument("--loop-posts", type=int, default=2_000, help="posts created one request at a time")
+    parser.add_argument("--batch-sizes", default="100,1000,10000")
+    args = parser.parse_args()
+
+    common.reset_database()
+    common.seed(users=1, posts=0)
+
+    session = requests.Session()
+    session.headers["Authorization"] = f"Bearer {create_access_token({'user_id': 1})}"
+    def new_posts(count: int) -> list:
+        return [{"title": f"imported post {i}", "content": f"imported content {i} " * 5} for i in range(count)]
+
+    results = {}
+    with common.run_server() as (_, base_url):
+        start = time.perf_counter()
+        for post in new_posts(args.loop_posts):
+            session.post(f"{base_url}/posts/", json=post).raise_for_status()
+        results["loop POST /posts/"] = round(args.loop_posts / (time.perf_counter() - start))
+
+        for batch_size in (int(size) for size in args.batch_sizes.split(",")):
+            batch = new_posts(batch_size)
+            start = time.perf_counter()
+            for _ in range(max(1, args.posts // batch_size)):
+                session.post(f"{base_url}/posts/bulk", json=batch).raise_for_status()
+            created = max(1, args.posts // batch_size) * batch_size
+            results[f"POST /posts/bulk x{batch_size}"] = round(created / (time.perf_counter() - start))
+
+    for name, posts_per_second in results.items():
+        print(f"{name:>26}: {posts_per_second:>9} posts/s")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
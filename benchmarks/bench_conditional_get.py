@@ -0,0 +1,60 @@
+"""Polling GET /posts/{id} and GET /users/{id}: full responses vs If-None-Match revalidation.
+
+    python -m benchmarks.bench_conditional_get --polls 500
+
+Each mode polls the same resources; bytes are the response bodies the client had to download.
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from app.cache import response_cache
+from . import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=10_000)
+    parser.add_argument("--votes-per-post", type=int, default=3)
+    parser.add_argument("--polls", type=int, default=500)
+    args = parser.parse_args()
+
+    common.reset_database()
+    common.seed(args.users, args.posts, args.votes_per_post)
+    client = common.bench_client()
+
+    resources = [f"/posts/{id}" for id in random.sample(range(1, args.posts + 1), 20)]
+    resources += [f"/users/{id}" for id in random.sample(range(1, args.users + 1), 5)]
+    etags = {url: client.get(url).headers["etag"] for url in resources}
+
+    def poll(conditional: bool, cold_cache: bool):
+        downloaded = []
+        asyncio.run(response_cache.clear())
+        if not cold_cache:
+            for url in resources: # ! a 304 from the version probe never fills the cache, so prime it
+                client.get(url)
+        def request():
+            url = random.choice(resources)
+            if cold_cache:
+                asyncio.run(response_cache.clear())
+            headers = {"If-None-Match": etags[url]} if conditional else {}
+            downloaded.append(len(client.get(url, headers=headers).content))
+        latency = common.measure(request, args.polls)
+        return {**latency, "body_bytes_per_poll": round(sum(downloaded) / len(downloaded), 1)}
+
+    results = {
+        "full, cold cache": poll(conditional=False, cold_cache=True),
+        "full, warm cache": poll(conditional=False, cold_cache=False),
+        "if-none-match, cold cache": poll(conditional=True, cold_cache=True),
+        "if-none-match, warm cache": poll(conditional=True, cold_cache=False),
+    }
+    for name, result in results.items():
+        print(f"{name:>26}: p50 {result['p50_ms']:>8.3f} ms | {result['body_bytes_per_poll']:>7.1f} bytes per poll")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
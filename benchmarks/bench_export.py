@@ -0,0 +1,61 @@
+"""Peak RSS of the API process while streaming GET /posts/export, for growing table sizes.
+
+    python -m benchmarks.bench_export --sizes 10000,100000,1000000
+
+Runs a real uvicorn process per size and reads its VmHWM (peak resident set) from /proc,
+so this one is Linux only. A streaming export should peak at about the same RSS for every size.
+"""
+import argparse
+import json
+import time
+
+import requests
+
+from app.oauth2 import create_access_token
+from . import common
+
+
+def rss_kb(pid: int, field: str) -> int:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1])
+    raise RuntimeError(f"{field} not found for pid {pid}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma separated post counts")
+    args = parser.parse_args()
+
+    headers = {"Authorization": f"Bearer {create_access_token({'user_id': 1})}"}
+    results = []
+    for size in (int(size) for size in args.sizes.split(",")):
+        common.reset_database()
+        common.seed(args.users, size)
+
+        with common.run_server() as (process, base_url):
+            requests.get(f"{base_url}/posts/", headers=headers).raise_for_status() # ! warm up imports and the pool
+            before_kb = rss_kb(process.pid, "VmRSS")
+
+            start = time.perf_counter()
+            exported = 0
+            with requests.get(f"{base_url}/posts/export", headers=headers, stream=True) as res:
+                res.raise_for_status()
+                for line in res.iter_lines():
+                    exported += bool(line)
+            seconds = time.perf_counter() - start
+
+            result = {"posts": size, "exported": exported, "seconds": round(seconds, 2),
+                      "rows_per_second": round(exported / seconds), "rss_before_mb": round(before_kb / 1024, 1),
+                      "peak_rss_mb": round(rss_kb(process.pid, "VmHWM") / 1024, 1)}
+        results.append(result)
+        print(f"{size:>9} posts: {result['seconds']:>7.2f} s | peak RSS {result['peak_rss_mb']:>7.1f} MB "
+              f"(idle {result['rss_before_mb']} MB)")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
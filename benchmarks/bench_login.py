@@ -0,0 +1,82 @@
+"""Login burst against a real uvicorn worker: login throughput and how much the
+burst slows down an unrelated endpoint (GET /) polled at the same time.
+
+    python -m benchmarks.bench_login --logins 400 --concurrency 32 --workers 4
+
+Compare --workers values (and --bcrypt-rounds) to size the hashing pool; 503s mean
+the hashing queue (--max-queue) was full and the request was shed.
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from passlib.context import CryptContext
+
+from . import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--logins", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    args = parser.parse_args()
+
+    common.reset_database()
+    # ! stored hashes carry their own cost factor, so seed them with the rounds under test
+    password_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=args.bcrypt_rounds).hash("password123")
+    common.seed(args.users, posts=0, password_hash=password_hash)
+
+    with common.run_server(
+            password_hash_workers=args.workers,
+            password_hash_max_queue=args.max_queue,
+            bcrypt_rounds=args.bcrypt_rounds) as (_, base_url):
+        stop = threading.Event()
+        probe_samples = []
+
+        def probe():
+            with requests.Session() as http:
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    http.get(f"{base_url}/")
+                    probe_samples.append((time.perf_counter() - start) * 1000)
+                    time.sleep(0.01)
+
+        def login(i: int):
+            start = time.perf_counter()
+            res = requests.post(f"{base_url}/login", data={
+                "username": f"bench{1 + i % args.users}@example.com", "password": "password123"})
+            return res.status_code, (time.perf_counter() - start) * 1000
+
+        prober = threading.Thread(target=probe)
+        prober.start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            results = list(pool.map(login, range(args.logins)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        prober.join()
+        token = requests.post(f"{base_url}/login", data={
+            "username": "bench1@example.com", "password": "password123"}).json()["access_token"]
+        hasher = requests.get(f"{base_url}/metrics/", headers={
+            "Authorization": f"Bearer {token}"}).json()["password_hasher"]
+
+    ok = [ms for status, ms in results if status == 200]
+    report = {
+        "logins_per_second": round(len(ok) / elapsed, 1),
+        "shed_503": sum(1 for status, _ in results if status == 503),
+        "login": common.summarize(ok) if ok else None,
+        "root_during_burst": common.summarize(probe_samples),
+        "password_hasher": hasher,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
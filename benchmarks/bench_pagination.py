@@ -0,0 +1,55 @@
+"""Latency of GET /posts as pages get deeper: LIMIT/OFFSET (`skip`) vs keyset (`cursor`).
+
+    python -m benchmarks.bench_pagination --posts 200000 --depths 1,10,100,1000,10000
+
+Offset latency grows with the page number, keyset latency should stay flat.
+"""
+import argparse
+import json
+
+from sqlalchemy import text
+
+from app import utils
+from . import common
+
+
+def cursor_at(offset: int) -> str:
+    with common.engine.connect() as conn:
+        created_at, id = conn.execute(text(
+            "SELECT created_at, id FROM posts ORDER BY created_at DESC, id DESC OFFSET :offset LIMIT 1"
+        ), {"offset": offset}).one()
+    return utils.encode_cursor(created_at, id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--votes-per-post", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--depths", default="1,10,100,1000,5000", help="comma separated page numbers")
+    args = parser.parse_args()
+
+    common.reset_database()
+    common.seed(args.users, args.posts, args.votes_per_post)
+    client = common.bench_client()
+
+    results = []
+    for page in (int(depth) for depth in args.depths.split(",")):
+        skip = (page - 1) * args.limit
+        if skip >= args.posts:
+            continue
+        offset = common.measure(
+            lambda: client.get("/posts/", params={"limit": args.limit, "skip": skip}), args.repeat)
+        cursor = cursor_at(skip - 1) if skip else ""
+        keyset = common.measure(
+            lambda: client.get("/posts/", params={"limit": args.limit, "cursor": cursor}), args.repeat)
+        results.append({"page": page, "offset": offset, "keyset": keyset})
+        print(f"page {page:>7}: offset p50 {offset['p50_ms']:>9.3f} ms | keyset p50 {keyset['p50_ms']:>9.3f} ms")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Search latency: the old `title LIKE '%term%'` scan vs the full-text GIN index path.
+
+    python -m benchmarks.bench_search --posts 1000000
+
+Every seeded title carries one of 1000 `topicN` words, so a topic matches ~0.1% of the
+rows; a missing term is the worst case for the LIKE scan (it never stops early).
+"""
+import argparse
+import json
+
+from sqlalchemy import text
+
+from . import common
+
+
+LIKE_QUERY = text("""
+    SELECT id, title, content, vote_count FROM posts
+    WHERE title LIKE '%' || :term || '%' LIMIT :limit
+""")
+
+FULL_TEXT_QUERY = text("""
+    SELECT id, title, content, vote_count FROM posts
+    WHERE search_vector @@ websearch_to_tsquery('english', :term)
+    ORDER BY ts_rank(search_vector, websearch_to_tsquery('english', :term)) DESC, id LIMIT :limit
+""")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    common.reset_database()
+    common.seed(args.users, args.posts)
+    client = common.bench_client()
+
+    results = {}
+    with common.engine.connect() as conn:
+        for label, term in (("rare term", "topic123"), ("missing term", "pepperoni")):
+            params = {"term": term, "limit": args.limit}
+            like = common.measure(lambda: conn.execute(LIKE_QUERY, params).all(), args.repeat)
+            full_text = common.measure(lambda: conn.execute(FULL_TEXT_QUERY, params).all(), args.repeat)
+            endpoint = common.measure(
+                lambda: client.get("/posts/", params={"search": term, "limit": args.limit}), args.repeat)
+            results[label] = {"like": like, "full_text": full_text, "endpoint": endpoint}
+            print(f"{label:>12}: LIKE p50 {like['p50_ms']:>9.3f} ms | full-text p50 {full_text['p50_ms']:>9.3f} ms"
+                  f" | GET /posts p50 {endpoint['p50_ms']:>9.3f} ms")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""CPU cost of serializing one feed page (List[schemas.PostOut]) per response path.
+
+    python -m benchmarks.bench_serialization --items 100
+
+No database needed: rows are built in memory with the same attributes as the ORM rows.
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from app import schemas, serializers
+
+
+def fake_rows(count: int) -> list:
+    now = datetime.now(timezone.utc)
+    owner = SimpleNamespace(id=1, email="owner@example.com", created_at=now)
+    return [SimpleNamespace(
+        Post=SimpleNamespace(
+            id=i, title=f"post {i}", content=f"content of post {i} " * 10, published=True,
+            created_at=now - timedelta(seconds=i), owner_id=owner.id, owner=owner),
+        votes=i % 50) for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = fake_rows(args.items)
+    paths = {
+        # ! what FastAPI does for a response_model: validate, jsonable_encoder, then render
+        "validate + jsonable_encoder + json": lambda: JSONResponse(
+            jsonable_encoder([schemas.PostOut.from_orm(row) for row in rows])).body,
+        "validate + jsonable_encoder + orjson": lambda: ORJSONResponse(
+            jsonable_encoder([schemas.PostOut.from_orm(row) for row in rows])).body,
+        "rows straight to orjson bytes": lambda: serializers.dumps(
+            [serializers.post_out(row) for row in rows]),
+    }
+
+    results = {}
+    for name, render in paths.items():
+        seconds = min(timeit.repeat(render, number=args.number, repeat=5)) / args.number
+        results[name] = round(seconds * 1e6, 1)
+        print(f"{name:>38}: {results[name]:>10.1f} us per page of {args.items}")
+
+    print(json.dumps({"items": args.items, "us_per_page": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Signup throughput against a real uvicorn worker, for new emails and for duplicates.
+
+    python -m benchmarks.bench_signup --signups 200 --concurrency 16
+
+Duplicate signups should be answered (409) without paying for a bcrypt hash, so
+their throughput is bounded by the database rather than by the hashing pool.
+Run it on an older revision to get the "before" numbers.
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from . import common
+
+
+def burst(base_url: str, emails: list, concurrency: int) -> dict:
+    def signup(email: str):
+        start = time.perf_counter()
+        res = requests.post(f"{base_url}/users/", json={"email": email, "password": "password123"})
+        return res.status_code, (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(signup, emails))
+    elapsed = time.perf_counter() - start
+
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    return {
+        "requests_per_second": round(len(results) / elapsed, 1),
+        "statuses": statuses,
+        "latency": common.summarize([ms for _, ms in results]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--signups", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    args = parser.parse_args()
+
+    common.reset_database()
+    common.seed(args.users, posts=0)
+
+    with common.run_server(bcrypt_rounds=args.bcrypt_rounds) as (_, base_url):
+        report = {
+            "duplicate": burst(
+                base_url, [f"bench{1 + i % args.users}@example.com" for i in range(args.signups)], args.concurrency),
+            "new": burst(
+                base_url, [f"new{i}@example.com" for i in range(args.signups)], args.concurrency),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
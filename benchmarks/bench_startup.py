@@ -0,0 +1,92 @@
+"""Cold start: how long `import app.main` takes in a fresh interpreter, and which imports cost the most.
+
+    python -m benchmarks.bench_startup --output startup.json
+    python -m benchmarks.bench_startup --baseline startup.json --tolerance 0.2
+    python -m benchmarks.bench_startup --max-ms 600
+
+Every run is a new `python -X importtime -c "import app.main"` process (no database needed);
+the report has the median cumulative import time of app.main and the slowest top-level
+packages. Exits with status 1 when app.main got slower than the baseline by more than
+--tolerance, or slower than --max-ms.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+
+def import_times(module: str) -> Dict[str, float]:
+    # ? `-X importtime` prints "import time: self [us] | cumulative | imported package" to stderr
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}).stderr
+
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(cumulative_us) / 1000
+    return cumulative
+
+
+def measure(module: str, runs: int, top: int) -> dict:
+    samples: List[Dict[str, float]] = [import_times(module) for _ in range(runs)]
+    # ? a package's own line includes everything it imported itself (fastapi includes starlette and pydantic)
+    packages: Dict[str, List[float]] = {}
+    for sample in samples:
+        for name, ms in sample.items():
+            if "." not in name and name != module.split(".")[0]:
+                packages.setdefault(name, []).append(ms)
+
+    total = [sample[module] for sample in samples]
+    slowest = sorted(((name, statistics.median(ms)) for name, ms in packages.items()),
+                     key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "runs": runs,
+        "median_ms": round(statistics.median(total), 1),
+        "min_ms": round(min(total), 1),
+        "max_ms": round(max(total), 1),
+        "slowest_imports_ms": {name: round(ms, 1) for name, ms in slowest},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10, help="how many of the slowest imports to report")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--max-ms", type=float, help="fail when the median import time is above this")
+    args = parser.parse_args()
+
+    import_times(args.module) # ! warm up the OS file cache (and the .pyc files), the first run is always an outlier
+    report = measure(args.module, args.runs, args.top)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    print(json.dumps(report, indent=2))
+
+    found = []
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            before = json.load(baseline)["median_ms"]
+        if report["median_ms"] > before * (1 + args.tolerance):
+            found.append(f"{args.module}: {before} -> {report['median_ms']} ms")
+    if args.max_ms is not None and report["median_ms"] > args.max_ms:
+        found.append(f"{args.module}: {report['median_ms']} ms > {args.max_ms} ms")
+
+    if found:
+        print("startup regressions:\n  " + "\n  ".join(found))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Shared helpers for the benchmark scripts.
+
+The benchmarks run against a dedicated `<DATABASE_NAME>_bench` database (create it
+once, like the `_test` database used by pytest) and drive the real app through
+TestClient. Run them from the repo root, e.g. `python -m benchmarks.bench_pagination`.
+"""
+import contextlib
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app import utils
+from app.config import settings
+from app.database import Base, get_db
+from app.main import app
+from app.oauth2 import create_access_token
+
+
+BENCH_DATABASE_URL = f"postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}_bench"
+
+engine = create_engine(BENCH_DATABASE_URL)
+
+# ! TestClient runs every request on a fresh event loop, so asyncpg connections can't be pooled across requests
+async_engine = create_async_engine(
+    BENCH_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1), poolclass=NullPool)
+
+BenchSessionLocal = sessionmaker(
+    async_engine, class_=AsyncSession, autocommit=False, autoflush=False, expire_on_commit=False)
+
+
+def reset_database():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def seed(users: int, posts: int, votes_per_post: int = 0, password_hash: Optional[str] = None):
+    # ? generate_series keeps seeding of large tables inside postgres (no per-row round trips)
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO users (email, password)
+            SELECT 'bench' || g || '@example.com', :password FROM generate_series(1, :users) AS g
+        """), {"users": users, "password": password_hash or utils.hash("password123")})
+        conn.execute(text("""
+            INSERT INTO posts (title, content, owner_id, created_at)
+            SELECT 'post ' || g || ' about topic' || g % 1000, 'content of post ' || g, 1 + g % :users,
+                   now() - make_interval(secs => g)
+            FROM generate_series(1, :posts) AS g
+        """), {"users": users, "posts": posts})
+        if votes_per_post:
+            conn.execute(text("""
+                INSERT INTO votes (user_id, post_id)
+                SELECT u, p FROM generate_series(1, :posts) AS p, generate_series(1, :voters) AS u
+            """), {"posts": posts, "voters": min(votes_per_post, users)})
+            conn.execute(text("UPDATE posts SET vote_count = :voters"), {"voters": min(votes_per_post, users)})
+        conn.execute(text("ANALYZE"))
+
+
+def bench_client(user_id: int = 1) -> TestClient:
+    async def override_get_db():
+        db = BenchSessionLocal()
+        try:
+            yield db
+        finally:
+            await db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    client = TestClient(app)
+    client.headers["Authorization"] = f"Bearer {create_access_token({'user_id': user_id})}"
+    return client
+
+
+@contextlib.contextmanager
+def run_server(port: int = 8765, **settings_env):
+    # ? a real uvicorn process on the bench database, for benchmarks that need true concurrency
+    env = {**os.environ, "DATABASE_NAME": f"{settings.database_name}_bench"}
+    env.update({name.upper(): str(value) for name, value in settings_env.items()})
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"], env=env)
+    base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                requests.get(base_url, timeout=1)
+                break
+            except requests.ConnectionError:
+                if time.monotonic() > deadline or process.poll() is not None:
+                    raise RuntimeError("uvicorn did not come up")
+                time.sleep(0.1)
+        yield process, base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    def percentile(p: float) -> float:
+        return round(samples[min(len(samples) - 1, int(len(samples) * p))], 3)
+
+    return {
+        "mean_ms": round(statistics.mean(samples), 3),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def measure(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    fn() # ! warm up caches and connections before timing
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    return summarize(samples)
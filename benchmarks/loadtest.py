@@ -0,0 +1,178 @@
+"""Load test: drives the real endpoints of a uvicorn process at a fixed concurrency and
+records throughput and tail latency per endpoint.
+
+    docker compose -f docker-compose-bench.yml up -d     # or any local postgres with a <DATABASE_NAME>_bench database
+    python -m benchmarks.loadtest --output baseline.json
+    python -m benchmarks.loadtest --baseline baseline.json --tolerance 0.25
+
+Every endpoint runs on its own for --duration seconds (after --warmup), so its RPS isn't
+shared with the others. With --baseline the run exits with status 1 when an endpoint got
+slower (p95 up) or served less (RPS down) by more than --tolerance, or returned errors.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from typing import Callable, Dict, List
+
+import requests
+from passlib.context import CryptContext
+
+from app.oauth2 import create_access_token
+from . import common
+
+
+PASSWORD = "password123"
+
+
+def scenarios(args) -> Dict[str, Callable[[requests.Session, int], requests.Response]]:
+    # ? each scenario gets the worker's session and number, and sends one request
+    def vote(http: requests.Session, worker: int) -> requests.Response:
+        # ! one voter per worker that never voted in the seed, toggling so every request is a valid change
+        state = vote_state.setdefault(worker, {"post_id": worker + 1, "dir": 1})
+        res = http.post("/vote/", json={"post_id": state["post_id"], "dir": state["dir"]},
+                        headers=auth(args.votes_per_post + 1 + worker))
+        if state["dir"] == 0:
+            state["post_id"] = 1 + (state["post_id"] + args.concurrency - 1) % args.posts
+        state["dir"] = 1 - state["dir"]
+        return res
+
+    vote_state = {}
+    return {
+        "get_posts": lambda http, worker: http.get("/posts/", params={"limit": 10}, headers=auth(1 + worker)),
+        "get_posts_cursor": lambda http, worker: http.get(
+            "/posts/", params={"limit": 10, "cursor": ""}, headers=auth(1 + worker)),
+        "search": lambda http, worker: http.get(
+            "/posts/", params={"search": f"topic{random.randrange(1000)}"}, headers=auth(1 + worker)),
+        "get_post": lambda http, worker: http.get(
+            f"/posts/{random.randint(1, args.posts)}", headers=auth(1 + worker)),
+        "vote": vote,
+        "login": lambda http, worker: http.post("/login", data={
+            "username": f"bench{random.randint(1, args.users)}@example.com", "password": PASSWORD}),
+    }
+
+
+tokens = {}
+
+def auth(user_id: int) -> dict:
+    if user_id not in tokens:
+        tokens[user_id] = {"Authorization": f"Bearer {create_access_token({'user_id': user_id})}"}
+    return tokens[user_id]
+
+
+class PrefixedSession(requests.Session):
+    def __init__(self, base_url: str):
+        super().__init__()
+        self.base_url = base_url
+
+    def request(self, method, url, *args, **kwargs):
+        return super().request(method, self.base_url + url, *args, **kwargs)
+
+
+def run_endpoint(base_url: str, send: Callable, concurrency: int, warmup: float, duration: float) -> dict:
+    samples: List[float] = []
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    measure_from, stop_at = start + warmup, start + warmup + duration
+
+    def worker(number: int):
+        with PrefixedSession(base_url) as http:
+            while True:
+                sent = time.perf_counter()
+                if sent >= stop_at:
+                    return
+                try:
+                    status = send(http, number).status_code
+                except requests.RequestException as error:
+                    status = type(error).__name__
+                elapsed_ms = (time.perf_counter() - sent) * 1000
+                if sent < measure_from:
+                    continue
+                with lock:
+                    if isinstance(status, int) and status < 400:
+                        samples.append(elapsed_ms)
+                    else:
+                        errors[str(status)] = errors.get(str(status), 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    result = {"requests": len(samples), "errors": errors, "rps": round(len(samples) / duration, 1)}
+    if samples:
+        result.update(common.summarize(samples))
+    return result
+
+
+def regressions(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    found = []
+    for name, before in baseline["endpoints"].items():
+        after = report["endpoints"].get(name)
+        if after is None:
+            continue
+        if after["errors"]:
+            found.append(f"{name}: errors {after['errors']}")
+        if "p95_ms" in before and after.get("p95_ms", float("inf")) > before["p95_ms"] * (1 + tolerance):
+            found.append(f"{name}: p95 {before['p95_ms']} -> {after.get('p95_ms')} ms")
+        if after["rps"] < before["rps"] * (1 - tolerance):
+            found.append(f"{name}: rps {before['rps']} -> {after['rps']}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--votes-per-post", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10, help="measured seconds per endpoint")
+    parser.add_argument("--warmup", type=float, default=2, help="unmeasured seconds per endpoint")
+    parser.add_argument("--endpoints", default="get_posts,get_posts_cursor,search,get_post,vote,login")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the request mix")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="JSON report of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    if args.users < args.votes_per_post + args.concurrency:
+        parser.error("--users must leave one voter per worker beyond --votes-per-post")
+
+    random.seed(args.seed)
+    common.reset_database()
+    # ! stored hashes carry their own cost factor, so seed them with the rounds under test
+    password_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=args.bcrypt_rounds).hash(PASSWORD)
+    common.seed(args.users, args.posts, args.votes_per_post, password_hash=password_hash)
+
+    report = {"config": {name: value for name, value in vars(args).items() if name not in ("output", "baseline")},
+              "endpoints": {}}
+    endpoints = scenarios(args)
+    with common.run_server(bcrypt_rounds=args.bcrypt_rounds) as (_, base_url):
+        for name in args.endpoints.split(","):
+            result = run_endpoint(base_url, endpoints[name], args.concurrency, args.warmup, args.duration)
+            report["endpoints"][name] = result
+            print(f"{name:>18}: {result['rps']:>8.1f} rps | p50 {result.get('p50_ms', '-'):>8} ms | "
+                  f"p95 {result.get('p95_ms', '-'):>8} ms | p99 {result.get('p99_ms', '-'):>8} ms | errors {result['errors']}")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            found = regressions(report, json.load(baseline), args.tolerance)
+        if found:
+            print("regressions against the baseline:\n  " + "\n  ".join(found))
+            sys.exit(1)
+        print("no regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
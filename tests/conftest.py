@@ -1,6 +1,11 @@
+import asyncio
+import contextlib
+
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import NullPool
 import pytest
 
 from app.main import app
@@ -8,7 +13,8 @@ from app import schemas
 from app.config import settings
 from app.database import get_db, Base
 from app.oauth2 import create_access_token
-from app import models
+from app import models, oauth2
+from app.cache import response_cache
 
 
 SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}_test"
@@ -17,6 +23,13 @@ engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# ! TestClient runs every request on a fresh event loop, so asyncpg connections can't be pooled across requests
+async_engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1), poolclass=NullPool)
+
+TestingAsyncSessionLocal = sessionmaker(
+    async_engine, class_=AsyncSession, autocommit=False, autoflush=False, expire_on_commit=False)
+
 
 #? getting access to the database object
 @pytest.fixture()
@@ -33,16 +46,38 @@ def session():
 @pytest.fixture()
 def client(session):
     #? run our code before we run our test
-    def override_get_db():
+    async def override_get_db():
+        db = TestingAsyncSessionLocal()
         try:
-            yield session
+            yield db
         finally:
-            session.close()
+            await db.close()
     app.dependency_overrides[get_db] = override_get_db
+    # ! ids restart with every fresh database, so nothing cached by a previous test may survive
+    asyncio.run(response_cache.clear())
+    oauth2.user_cache.clear()
     yield TestClient(app)
     #? run our code after our test finishes
 
 
+#? statement budget: fails the test when the app runs more SQL statements than allowed
+@pytest.fixture
+def assert_max_queries():
+    @contextlib.contextmanager
+    def check(budget: int):
+        statements = []
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+        try:
+            yield statements
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+        assert len(statements) <= budget, f"{len(statements)} statements (budget {budget}):\n" + "\n".join(statements)
+    return check
+
+
 @pytest.fixture
 def test_user(client: TestClient) -> dict:
     user_data = {
@@ -0,0 +1,176 @@
+import asyncio
+
+from fastapi import Response
+from fastapi.testclient import TestClient
+
+from app.cache import MemoryBackend, RedisBackend, ResponseCache, TTLCache, response_cache
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_ttl_cache_expires_entries():
+    timer = FakeTimer()
+    cache = TTLCache(max_size=10, ttl=5, timer=timer)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=20)
+
+    timer.now = 4.9
+    assert cache.get("a") == 1
+    timer.now = 5
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert len(cache) == 1
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_resize_evicts_down_to_the_new_size():
+    cache = TTLCache(max_size=3, ttl=60)
+    for key in "abc":
+        cache.set(key, key)
+    cache.resize(max_size=1, ttl=5)
+
+    assert len(cache) == 1 and cache.get("c") == "c"
+    assert cache.ttl == 5
+
+
+def test_post_detail_served_from_cache(authorized_client: TestClient, test_posts: list, assert_max_queries):
+    post_id = test_posts[0].id
+    first = authorized_client.get(f"/posts/{post_id}")
+    with assert_max_queries(0):
+        second = authorized_client.get(f"/posts/{post_id}")
+    assert second.json() == first.json()
+    assert response_cache.snapshot()["hits"] >= 1
+
+
+def test_update_and_vote_invalidate_post_detail(authorized_client: TestClient, test_posts: list):
+    post_id, other_post_id = test_posts[0].id, test_posts[3].id
+    authorized_client.get(f"/posts/{post_id}")
+    authorized_client.get(f"/posts/{other_post_id}")
+
+    authorized_client.put(f"/posts/{post_id}", json={"title": "updated title", "content": "updated content"})
+    assert authorized_client.get(f"/posts/{post_id}").json()["Post"]["title"] == "updated title"
+
+    authorized_client.post("/vote/", json={"post_id": other_post_id, "dir": 1})
+    assert authorized_client.get(f"/posts/{other_post_id}").json()["votes"] == 1
+
+
+def test_create_and_delete_invalidate_feed(authorized_client: TestClient, test_posts: list):
+    post_id = test_posts[0].id
+    assert len(authorized_client.get("/posts/").json()) == 4
+
+    authorized_client.post("/posts/", json={"title": "new title", "content": "new content"})
+    assert len(authorized_client.get("/posts/").json()) == 5
+
+    authorized_client.delete(f"/posts/{post_id}")
+    assert len(authorized_client.get("/posts/").json()) == 4
+    assert authorized_client.get(f"/posts/{post_id}").status_code == 404
+
+
+def test_post_detail_loaded_before_a_write_is_not_served():
+    async def run():
+        cache = ResponseCache(MemoryBackend(max_size=10, ttl=60))
+        # ? a reader takes the key and loads the row, a write commits and invalidates, then the reader stores
+        reader_key = await cache.post_key(1)
+        await cache.invalidate_posts(1)
+        await cache.set(reader_key, Response(b'{"votes":0}'))
+        return await cache.get(await cache.post_key(1))
+
+    assert asyncio.run(run()) is None
+
+
+def test_feed_keys_of_different_params_never_collide():
+    async def run():
+        cache = ResponseCache(MemoryBackend(max_size=10, ttl=60))
+        return (await cache.feed_key(limit=10, cursor="&limit=10&search=x", search="y"),
+                await cache.feed_key(limit=10, cursor="", search="x&limit=10&search=y"))
+
+    first, second = asyncio.run(run())
+    assert first != second
+
+
+def test_invalid_cursor_is_rejected_before_the_cache(authorized_client: TestClient, test_posts: list):
+    assert authorized_client.get("/posts/", params={"cursor": ""}).status_code == 200
+    res = authorized_client.get("/posts/", params={"cursor": "&limit=10"})
+    assert res.status_code == 400
+
+
+def test_generation_counters_expire_after_the_entries():
+    async def run():
+        timer = FakeTimer()
+        backend = MemoryBackend(max_size=10, ttl=60, timer=timer)
+        cache = ResponseCache(backend)
+        await cache.invalidate_posts(1, 2)
+        timer.now = 500
+        await cache.invalidate_posts(2)
+        stale_key = await cache.post_key(2)
+
+        timer.now = 700 # ! past post 1's counter_ttl (600s), only post 2 was bumped since
+        await cache.invalidate_posts(3)
+        return await cache.post_key(1), stale_key, list(backend._counters)
+
+    post_1_key, post_2_key, counters = asyncio.run(run())
+    assert post_1_key == "posts:1:0"
+    assert post_2_key == "posts:2:2"
+    assert counters == ["posts:2:generation", "posts:3:generation", "posts:feed:generation"]
+
+
+class FakeRedis:
+    # ? just enough of redis.asyncio.Redis for the RedisBackend
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def expire(self, key, seconds):
+        self.expiry[key] = seconds
+
+    async def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1).encode()
+        return int(self.data[key])
+
+
+def test_redis_backend_response_cache():
+    async def run():
+        redis = FakeRedis()
+        cache = ResponseCache(RedisBackend(redis, ttl=30))
+        feed_key = await cache.feed_key(limit=10, skip=0)
+        await cache.set(feed_key, Response(b'[{"id":1}]', headers={"X-Next-Cursor": "abc"}))
+        await cache.set(await cache.post_key(1), Response(b'{"id":1}'))
+
+        cached = await cache.get(feed_key)
+        assert cached.body == b'[{"id":1}]'
+        assert cached.headers["x-next-cursor"] == "abc"
+
+        await cache.invalidate_posts(1)
+        assert await cache.get(await cache.post_key(1)) is None
+        assert await cache.feed_key(limit=10, skip=0) != feed_key
+        assert redis.expiry == {"api-cache:posts:1:generation": 300, "api-cache:posts:feed:generation": 300}
+        return cache.snapshot()
+
+    assert asyncio.run(run()) == {"backend": "RedisBackend", "hits": 1, "misses": 1, "evictions": 0}
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import utils
+from app.cache import response_cache
+
+
+def test_get_post_not_modified(authorized_client: TestClient, test_posts: list, assert_max_queries):
+    post_id = test_posts[0].id
+    res = authorized_client.get(f"/posts/{post_id}")
+    etag = res.headers["etag"]
+
+    # ? served from the response cache: no query at all
+    with assert_max_queries(0):
+        res = authorized_client.get(f"/posts/{post_id}", headers={"If-None-Match": etag})
+    assert res.status_code == 304
+    assert res.content == b""
+    assert res.headers["etag"] == etag
+
+    # ? cold cache: only the version probe runs
+    asyncio.run(response_cache.clear())
+    with assert_max_queries(1):
+        res = authorized_client.get(f"/posts/{post_id}", headers={"If-None-Match": etag})
+    assert res.status_code == 304
+
+
+def test_get_post_etag_changes_on_write(authorized_client: TestClient, test_posts: list):
+    post_id = test_posts[0].id
+    etag = authorized_client.get(f"/posts/{post_id}").headers["etag"]
+
+    authorized_client.post("/vote/", json={"post_id": post_id, "dir": 1})
+    res = authorized_client.get(f"/posts/{post_id}", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.json()["votes"] == 1
+    assert res.headers["etag"] != etag
+
+    asyncio.run(response_cache.clear())
+    authorized_client.put(f"/posts/{post_id}", json={"title": "updated title", "content": "updated content"})
+    res = authorized_client.get(f"/posts/{post_id}", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.json()["Post"]["title"] == "updated title"
+
+
+def test_get_post_not_exist_with_etag(authorized_client: TestClient, test_posts: list):
+    res = authorized_client.get("/posts/88888", headers={"If-None-Match": "*"})
+    assert res.status_code == 404
+
+
+def test_get_user_not_modified(client: TestClient, test_user: dict):
+    res = client.get(f"/users/{test_user['id']}")
+    assert res.status_code == 200
+    etag = res.headers["etag"]
+
+    res = client.get(f"/users/{test_user['id']}", headers={"If-None-Match": f'W/"0-0", {etag}'})
+    assert res.status_code == 304
+    assert res.content == b""
+
+    assert client.get("/users/88888", headers={"If-None-Match": etag}).status_code == 404
+
+
+@pytest.mark.parametrize("if_none_match, matches", [
+    ('"1-42"', True),
+    ('W/"1-42"', True),
+    ('"1-41", "1-42"', True),
+    ('*', True),
+    ('"1-41"', False),
+    (None, False),
+])
+def test_etag_matches(if_none_match, matches):
+    assert utils.etag_matches(if_none_match, utils.make_etag(1, 42)) is matches
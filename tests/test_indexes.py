@@ -0,0 +1,102 @@
+import contextlib
+import json
+
+from fastapi.testclient import TestClient
+import pytest
+from sqlalchemy import event, text
+
+from app import utils
+from .conftest import async_engine, engine
+
+
+# ? relations the hot queries must reach through an index once the tables are big
+BIG_TABLES = {"users", "posts", "votes"}
+
+
+@pytest.fixture
+def seeded_client(authorized_client: TestClient, test_user: dict, session):
+    # ? enough rows that the planner prefers an index wherever one can be used
+    session.execute(text("""
+        INSERT INTO users (email, password)
+        SELECT 'seed' || g || '@example.com', 'not a hash' FROM generate_series(1, 50000) AS g
+    """))
+    session.execute(text("""
+        INSERT INTO posts (title, content, owner_id, created_at)
+        SELECT 'post ' || g || ' about topic' || g % 1000, 'content of post ' || g, :owner_id + g % 50000,
+               now() - make_interval(secs => g)
+        FROM generate_series(1, 50000) AS g
+    """), {"owner_id": test_user['id']})
+    session.execute(text("""
+        INSERT INTO votes (user_id, post_id)
+        SELECT u, p FROM generate_series(2, 51) AS u, generate_series(1, 50000, 10) AS p
+    """))
+    session.execute(text("UPDATE posts SET vote_count = 50 WHERE id % 10 = 1"))
+    session.commit()
+    session.execute(text("ANALYZE"))
+    return authorized_client
+
+
+@contextlib.contextmanager
+def capture_statements():
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+
+
+def seq_scans(plan: dict) -> list:
+    found = [plan["Relation Name"]] if plan["Node Type"] == "Seq Scan" and plan["Relation Name"] in BIG_TABLES else []
+    for child in plan.get("Plans", []):
+        found += seq_scans(child)
+    return found
+
+
+def explain(statement: str, parameters) -> dict:
+    # ! the asyncpg dialect uses the "format" paramstyle, which psycopg2 understands as well
+    with engine.connect() as conn:
+        cursor = conn.connection.cursor()
+        cursor.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+        plan = cursor.fetchone()[0]
+    return (plan if isinstance(plan, list) else json.loads(plan))[0]["Plan"]
+
+
+def test_hot_queries_use_indexes(seeded_client: TestClient, test_user: dict):
+    client = seeded_client
+    post_id = client.post("/posts/", json={"title": "my title", "content": "my content"}).json()["id"]
+    deep_cursor = utils.encode_cursor(*engine.execute(text(
+        "SELECT created_at, id FROM posts ORDER BY created_at DESC, id DESC OFFSET 30000 LIMIT 1")).one())
+
+    with capture_statements() as statements:
+        client.get("/posts/", params={"cursor": ""})
+        client.get("/posts/", params={"cursor": deep_cursor})
+        client.get("/posts/", params={"search": "topic7"})
+        for sort in ("hot", "top", "new"):
+            res = client.get("/posts/", params={"sort": sort})
+            res = client.get("/posts/", params={"sort": sort, "cursor": ""})
+            client.get("/posts/", params={"sort": sort, "cursor": res.headers["X-Next-Cursor"]})
+        client.get("/posts/", params={"search": "topic7", "cursor": ""})
+        client.get("/posts/11")
+        client.get("/posts/export", params={"owner_id": test_user['id'] + 7})
+        client.post("/vote/", json={"post_id": 11, "dir": 1})
+        client.post("/vote/", json={"post_id": 11, "dir": 0})
+        client.post("/vote/batch", json=[{"post_id": 21, "dir": 1}, {"post_id": 31, "dir": 0}])
+        client.put(f"/posts/{post_id}", json={"title": "updated title", "content": "updated content"})
+        client.put("/posts/11", json={"title": "updated title", "content": "updated content"})
+        client.delete(f"/posts/{post_id}")
+        client.get(f"/users/{test_user['id']}")
+
+    # ? foreign key cascades: postgres looks rows up by the referencing column on every delete
+    statements += [
+        ("SELECT 1 FROM votes WHERE post_id = %s", (11,)),
+        ("SELECT 1 FROM posts WHERE owner_id = %s", (test_user['id'],)),
+    ]
+
+    offenders = [(statement, scans) for statement, parameters in statements
+                 if (scans := seq_scans(explain(statement, parameters)))]
+    assert not offenders, "sequential scans on hot queries:\n" + "\n\n".join(
+        f"{scans}: {statement}" for statement, scans in offenders)
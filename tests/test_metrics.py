@@ -0,0 +1,128 @@
+import asyncio
+import json
+import logging
+
+from fastapi.testclient import TestClient
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.config import settings
+from app.database import create_api_engine
+from app.main import app
+from app.metrics import InstrumentedQueuePool, RequestQueries, current_queries, pool_metrics, query_timer
+from app.middleware import QueryTimingMiddleware
+from tests.conftest import SQLALCHEMY_DATABASE_URL, async_engine, engine
+
+
+def test_pool_metrics_count_checkouts_and_waits():
+    async def run():
+        engine = create_async_engine(
+            SQLALCHEMY_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1),
+            poolclass=InstrumentedQueuePool, pool_size=1, max_overflow=0)
+        pool_metrics.attach(engine.sync_engine)
+
+        async def query():
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT pg_sleep(0.05)"))
+
+        try:
+            await asyncio.gather(query(), query())
+        finally:
+            await engine.dispose()
+
+    pool_metrics.reset()
+    asyncio.run(run())
+    metrics = pool_metrics.snapshot()
+
+    assert metrics["checkouts"] == 2
+    assert metrics["connections_opened"] == 1
+    assert metrics["peak_in_use"] == 1
+    assert metrics["in_use"] == 0
+    assert metrics["waits"] == 1    # the first checkout opens the connection, only the second queues for it
+    assert metrics["wait_time_ms"] >= 50
+    assert metrics["connect_time_ms"] > 0
+
+
+def test_get_metrics(authorized_client: TestClient):
+    res = authorized_client.get("/metrics/")
+    assert res.status_code == 200
+    assert set(res.json()["pool"]) == {
+        "connections_opened", "checkouts", "in_use", "peak_in_use", "waits", "wait_time_ms", "connect_time_ms"}
+
+
+def test_unauthorized_get_metrics(client: TestClient):
+    res = client.get("/metrics/")
+    assert res.status_code == 401
+
+
+@pytest.fixture
+def timed_client(authorized_client: TestClient):
+    # ? the app only installs these when settings.sql_instrumentation is on
+    query_timer.attach(async_engine.sync_engine)
+    try:
+        client = TestClient(QueryTimingMiddleware(app))
+        client.headers = authorized_client.headers
+        yield client
+    finally:
+        query_timer.detach(async_engine.sync_engine)
+
+
+def test_server_timing_and_request_log(timed_client: TestClient, test_posts: list, caplog, assert_max_queries):
+    with caplog.at_level(logging.INFO, logger="app.requests"):
+        with assert_max_queries(1) as statements:
+            res = timed_client.get("/posts/")
+
+    assert res.status_code == 200
+    db, slowest, total = res.headers["server-timing"].split(", ")
+    assert db.startswith(f'db;desc="{len(statements)} statements";dur=')
+    assert slowest.startswith("db-slowest;dur=")
+    assert total.startswith("app;dur=")
+
+    line = json.loads(caplog.records[-1].getMessage())
+    assert line["event"] == "request"
+    assert (line["method"], line["path"], line["status"]) == ("GET", "/posts/", 200)
+    assert line["db_statements"] == 1
+    assert line["db_slowest"].startswith("SELECT posts.id")
+    assert line["db_ms"] >= line["db_slowest_ms"] > 0
+
+
+def test_failed_statements_leave_nothing_on_the_connection(session):
+    query_timer.attach(engine)
+    queries = RequestQueries()
+    token = current_queries.set(queries)
+    try:
+        with engine.connect() as conn:
+            with pytest.raises(DBAPIError):
+                conn.execute(text("SELECT 1 / 0"))
+            conn.execute(text("SELECT 1"))
+            assert "query_start_time" not in conn.info
+    finally:
+        current_queries.reset(token)
+        query_timer.detach(engine)
+
+    assert queries.count == 1
+
+
+def test_slow_query_log(timed_client: TestClient, test_posts: list, caplog, monkeypatch):
+    monkeypatch.setattr(settings, "slow_query_ms", 0)
+    with caplog.at_level(logging.WARNING, logger="app.sql"):
+        timed_client.get(f"/posts/{test_posts[0].id}")
+
+    slow = [json.loads(record.getMessage()) for record in caplog.records if record.name == "app.sql"]
+    assert [line["event"] for line in slow] == ["slow_query"]
+    assert slow[0]["statement"].startswith("SELECT posts.id")
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("", {"prepared_statement_cache_size": "0"}),
+    ("?ssl=require", {"ssl": "require", "prepared_statement_cache_size": "0"}),
+])
+def test_pgbouncer_engine_url_keeps_its_query(query: str, expected: dict):
+    api_engine = create_api_engine(
+        "postgresql+asyncpg://user:pw@replica:5432/db" + query, settings.copy(update={"database_pgbouncer": True}))
+    try:
+        assert dict(api_engine.url.query) == expected
+    finally:
+        asyncio.run(api_engine.dispose())
@@ -0,0 +1,120 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from cryptography.hazmat.primitives.serialization import Encoding, NoEncryption, PrivateFormat, PublicFormat
+from fastapi import HTTPException
+
+from app import oauth2
+from app.cache import TTLCache
+from tests.conftest import TestingAsyncSessionLocal
+
+
+def test_current_user_loads_row_lazily_and_caches_it(test_user: dict):
+    oauth2.user_cache.clear()
+
+    async def load_twice():
+        db = TestingAsyncSessionLocal()
+        try:
+            current_user = oauth2.CurrentUser(test_user['id'], db)
+            first = await current_user.load()
+            second = await current_user.load()
+            return first, second
+        finally:
+            await db.close()
+
+    first, second = asyncio.run(load_twice())
+    assert first.email == test_user['email']
+    assert second is first
+
+
+def test_current_user_unknown_id(session):
+    oauth2.user_cache.clear()
+
+    async def load():
+        db = TestingAsyncSessionLocal()
+        try:
+            return await oauth2.CurrentUser(88888, db).load()
+        finally:
+            await db.close()
+
+    assert asyncio.run(load()) is None
+
+
+@pytest.fixture
+def token_cache(monkeypatch):
+    clock = {"now": 0.0}
+    cache = TTLCache(100, 300, timer=lambda: clock["now"])
+    monkeypatch.setattr(oauth2, "token_cache", cache)
+    return clock
+
+
+@pytest.fixture
+def decode_calls(monkeypatch):
+    backend = oauth2.jwt_backend()
+    calls = []
+    def decode(token):
+        calls.append(token)
+        return oauth2.JWTBackend.decode(backend, token)
+    monkeypatch.setattr(backend, "decode", decode)
+    return calls
+
+
+def test_verified_tokens_are_cached_until_exp(token_cache: dict, decode_calls: list):
+    token = oauth2.jwt_backend().encode({"user_id": 7, "exp": int(time.time()) + 60})
+
+    assert oauth2.verify_access_token(token, None).id == "7"
+    assert oauth2.verify_access_token(token, None).id == "7"
+    assert len(decode_calls) == 1
+
+    # ? past the token's exp the cached entry is gone, and the token is checked again
+    token_cache["now"] += 61
+    oauth2.verify_access_token(token, None)
+    assert len(decode_calls) == 2
+
+
+def test_invalid_tokens_are_not_cached(token_cache: dict, decode_calls: list):
+    token = oauth2.create_access_token({"user_id": 7})[:-2] + "xx"
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            oauth2.verify_access_token(token, HTTPException(status_code=401))
+    assert len(decode_calls) == 2
+
+
+SECRET = "0123456789abcdef" * 2
+
+
+def pem_keys(private_key) -> dict:
+    return {
+        "private_key": private_key.private_bytes(
+            Encoding.PEM, PrivateFormat.PKCS8, NoEncryption()).decode(),
+        "public_key": private_key.public_key().public_bytes(
+            Encoding.PEM, PublicFormat.SubjectPublicKeyInfo).decode(),
+    }
+
+
+@pytest.mark.parametrize("name,algorithm,private_key", [
+    ("jose", "HS256", None),
+    ("jose", "ES256", ec.generate_private_key(ec.SECP256R1())),
+    ("pyjwt", "HS256", None),
+    ("pyjwt", "ES256", ec.generate_private_key(ec.SECP256R1())),
+    ("pyjwt", "EdDSA", ed25519.Ed25519PrivateKey.generate()),
+])
+def test_backends(name: str, algorithm: str, private_key):
+    if name == "pyjwt":
+        pytest.importorskip("jwt")
+    keys = pem_keys(private_key) if private_key else {}
+    signer = oauth2.JWTBackend(name, algorithm, SECRET, **keys)
+    verifier = oauth2.JWTBackend(name, algorithm, SECRET, public_key=keys.get("public_key"))
+
+    token = signer.encode({"user_id": 3, "exp": datetime.utcnow() + timedelta(minutes=1)})
+    assert verifier.decode(token)["user_id"] == 3
+    with pytest.raises(verifier.error):
+        verifier.decode(token[:-2] + "xx")
+
+
+def test_jose_has_no_eddsa():
+    with pytest.raises(ValueError):
+        oauth2.JWTBackend("jose", "EdDSA", SECRET, **pem_keys(ed25519.Ed25519PrivateKey.generate()))
@@ -1,7 +1,13 @@
+import json
+from datetime import datetime, timezone
+
+from fastapi.encoders import jsonable_encoder
 from fastapi.testclient import TestClient
 import pytest
+from sqlalchemy.orm import joinedload
 
-from app import schemas
+from app import models, schemas, serializers, utils
+from app.config import settings
 
 
 def test_get_all_posts(authorized_client: TestClient, test_posts: list):
@@ -12,6 +18,85 @@ def test_get_all_posts(authorized_client: TestClient, test_posts: list):
     assert res.status_code == 200
 
 
+def test_get_posts_cursor_pagination(authorized_client: TestClient, test_posts: list):
+    seen = []
+    res = authorized_client.get("/posts/", params={"limit": 3, "cursor": ""})
+    while True:
+        assert res.status_code == 200
+        seen += [schemas.PostOut(**x).Post.id for x in res.json()]
+        next_cursor = res.headers.get("X-Next-Cursor")
+        if next_cursor is None:
+            break
+        res = authorized_client.get("/posts/", params={"limit": 3, "cursor": next_cursor})
+
+    # all test posts share created_at (same transaction), so the id tie-breaker decides the order
+    assert seen == sorted((post.id for post in test_posts), reverse=True)
+
+
+def test_get_posts_invalid_cursor(authorized_client: TestClient, test_posts: list):
+    res = authorized_client.get("/posts/", params={"cursor": "not-a-cursor"})
+    assert res.status_code == 400
+
+
+@pytest.mark.parametrize("sort, value, id", [
+    ("new", datetime(2022, 1, 1, tzinfo=timezone.utc), 2**31),
+    ("new", datetime(2022, 1, 1, tzinfo=timezone.utc), -2**31 - 1),
+    ("top", 2**31, 1),
+    ("top", -2**31 - 1, 1),
+])
+def test_get_posts_cursor_out_of_int_range(authorized_client: TestClient, test_posts: list, sort: str, value, id: int):
+    # ! asyncpg can't bind these to integer columns, they must not get as far as the query
+    res = authorized_client.get("/posts/", params={"cursor": utils.encode_cursor(value, id, sort), "sort": sort})
+    assert res.status_code == 400
+
+
+@pytest.mark.parametrize("search, expected_titles", [
+    ("first", ["first title"]),
+    ("3rd content", ["3rd title"]),
+    ("titles", ["first title", "2nd title", "3rd title", "4th title"]),   # stemmed, matches 'title'
+    ("pepperoni", []),
+])
+def test_search_posts(authorized_client: TestClient, test_posts: list, search: str, expected_titles: list):
+    res = authorized_client.get("/posts/", params={"search": search})
+    assert res.status_code == 200
+    titles = [schemas.PostOut(**x).Post.title for x in res.json()]
+    assert sorted(titles) == sorted(expected_titles)
+
+
+@pytest.mark.parametrize("sort", ["hot", "top", "new"])
+def test_get_posts_sorted(authorized_client: TestClient, test_posts: list, sort: str):
+    post_ids = [post.id for post in test_posts]
+    authorized_client.post("/vote/batch", json=[{"post_id": post_ids[2], "dir": 1}, {"post_id": post_ids[1], "dir": 1}])
+    authorized_client.post("/vote/", json={"post_id": post_ids[2], "dir": 0})
+
+    # all test posts share created_at, so hot follows the votes (log10 of 1 and of 0 are both 0) and then the id
+    expected = {
+        "hot": sorted(post_ids, reverse=True),
+        "top": [post_ids[1]] + sorted(set(post_ids) - {post_ids[1]}, reverse=True),
+        "new": sorted(post_ids, reverse=True),
+    }[sort]
+
+    res = authorized_client.get("/posts/", params={"sort": sort})
+    assert [post["Post"]["id"] for post in res.json()] == expected
+
+    seen = []
+    res = authorized_client.get("/posts/", params={"sort": sort, "limit": 3, "cursor": ""})
+    while True:
+        seen += [post["Post"]["id"] for post in res.json()]
+        if "X-Next-Cursor" not in res.headers:
+            break
+        res = authorized_client.get("/posts/", params={"sort": sort, "limit": 3, "cursor": res.headers["X-Next-Cursor"]})
+    assert seen == expected
+
+
+def test_get_posts_sort_errors(authorized_client: TestClient, test_posts: list):
+    assert authorized_client.get("/posts/", params={"sort": "best"}).status_code == 422
+
+    res = authorized_client.get("/posts/", params={"sort": "top", "limit": 1, "cursor": ""})
+    res = authorized_client.get("/posts/", params={"sort": "hot", "cursor": res.headers["X-Next-Cursor"]})
+    assert res.status_code == 400
+
+
 def test_unauthorized_user_get_all_posts(client: TestClient, test_posts: list):
     res = client.get("/posts/")
     assert res.status_code == 401
@@ -27,6 +112,13 @@ def test_get_one_post_not_exist(authorized_client: TestClient, test_posts: list)
     assert res.status_code == 404
 
 
+@pytest.mark.parametrize("method", ["get", "put", "delete"])
+@pytest.mark.parametrize("id", [99999999999, -99999999999])
+def test_post_id_out_of_int_range(authorized_client: TestClient, test_posts: list, method: str, id: int):
+    res = authorized_client.request(method.upper(), f"/posts/{id}", json={"title": "t", "content": "c"})
+    assert res.status_code == 422
+
+
 def test_get_one_post(authorized_client: TestClient, test_posts: list):
     res = authorized_client.get(f"/posts/{test_posts[0].id}")
     post = schemas.PostOut(**res.json())
@@ -67,6 +159,40 @@ def test_create_post_default_published_true(authorized_client: TestClient, test_
     assert created_post.owner_id == test_user['id']
 
 
+def test_create_posts_bulk(authorized_client: TestClient, test_user: dict, test_posts: list):
+    new_posts = [{"title": f"bulk title {i}", "content": f"bulk content {i}"} for i in range(3)]
+    new_posts[1]["published"] = False
+    res = authorized_client.post("/posts/bulk", json=new_posts)
+
+    assert res.status_code == 201
+    created = [schemas.Post(**post) for post in res.json()]
+    assert [post.title for post in created] == [post["title"] for post in new_posts]
+    assert [post.published for post in created] == [True, False, True]
+    assert all(post.owner_id == test_user['id'] and post.owner.email == test_user['email'] for post in created)
+    assert len(authorized_client.get("/posts/", params={"limit": 100}).json()) == len(test_posts) + 3
+
+
+def test_create_posts_bulk_validates_each_item(authorized_client: TestClient, test_posts: list):
+    res = authorized_client.post("/posts/bulk", json=[
+        {"title": "bulk title", "content": "bulk content"}, {"title": "missing content"}])
+    assert res.status_code == 422
+    assert res.json()["detail"][0]["loc"] == ["body", 1, "content"]
+    assert len(authorized_client.get("/posts/").json()) == len(test_posts)
+
+
+def test_create_posts_bulk_too_large(authorized_client: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "post_bulk_max_size", 2)
+    res = authorized_client.post("/posts/bulk", json=[
+        {"title": f"bulk title {i}", "content": "bulk content"} for i in range(3)])
+    assert res.status_code == 413
+
+
+def test_create_posts_bulk_too_large_before_validation(authorized_client: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "post_bulk_max_size", 2)
+    res = authorized_client.post("/posts/bulk", json=[{"title": "missing content"}] * 3)
+    assert res.status_code == 413
+
+
 def test_unauthorized_user_create_post(client: TestClient, test_user: dict, test_posts: list):
     res = client.post("/posts/", json={
         "title": "test title",
@@ -130,4 +256,40 @@ def test_update_post_non_exist(authorized_client: TestClient, test_user: dict, t
         "id": test_posts[3].id
     }
     res = authorized_client.put(f"posts/88888", json=data)
-    assert res.status_code == 404
\ No newline at end of file
+    assert res.status_code == 404
+
+def test_post_serializer_matches_response_model(test_posts: list, session):
+    rows = session.query(models.Post, models.Post.vote_count.label("votes")).options(
+        joinedload(models.Post.owner)).all()
+
+    fast = json.loads(serializers.dumps([serializers.post_out(row) for row in rows]))
+    validated = json.loads(json.dumps(jsonable_encoder([schemas.PostOut.from_orm(row) for row in rows])))
+    assert fast == validated
+
+
+def test_export_posts(authorized_client: TestClient, test_posts: list):
+    res = authorized_client.get("/posts/export")
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/x-ndjson"
+
+    lines = [json.loads(line) for line in res.text.splitlines()]
+    assert [line["Post"]["id"] for line in lines] == sorted(post.id for post in test_posts)
+    for line in lines: # ! same shape as the detail endpoint
+        assert line == authorized_client.get(f"/posts/{line['Post']['id']}").json()
+
+
+def test_export_posts_filters(authorized_client: TestClient, test_user2: dict, test_posts: list):
+    res = authorized_client.get("/posts/export", params={"owner_id": test_user2['id']})
+    assert [json.loads(line)["Post"]["owner_id"] for line in res.text.splitlines()] == [test_user2['id']]
+
+    res = authorized_client.get("/posts/export", params={"search": "first"})
+    assert [json.loads(line)["Post"]["title"] for line in res.text.splitlines()] == ["first title"]
+
+
+@pytest.mark.parametrize("owner_id", [99999999999, -99999999999])
+def test_export_posts_owner_id_out_of_int_range(authorized_client: TestClient, test_posts: list, owner_id: int):
+    assert authorized_client.get("/posts/export", params={"owner_id": owner_id}).status_code == 422
+
+
+def test_unauthorized_user_export_posts(client: TestClient, test_posts: list):
+    assert client.get("/posts/export").status_code == 401
@@ -0,0 +1,50 @@
+from fastapi.testclient import TestClient
+import pytest
+
+
+# ? SQL statements each endpoint may run (BEGIN/COMMIT aside) - an N+1 shows up as a budget overrun
+@pytest.mark.parametrize("method, url, body, budget", [
+    ("get", "/posts/", None, 1),
+    ("get", "/posts/?cursor=", None, 1),
+    ("get", "/posts/?search=title", None, 1),
+    ("get", "/posts/{post_id}", None, 1),
+    ("post", "/posts/", lambda ids: {"title": "new title", "content": "new content"}, 2),
+    ("post", "/posts/bulk", lambda ids: [{"title": f"title {i}", "content": "content"} for i in range(20)], 2),
+    ("put", "/posts/{post_id}", lambda ids: {"title": "updated title", "content": "updated content"}, 2), # ! + the owner, cold user cache
+    ("delete", "/posts/{post_id}", None, 1),
+    ("post", "/vote/", lambda ids: {"post_id": ids['other_post_id'], "dir": 1}, 1),
+    ("post", "/vote/batch", lambda ids: [
+        {"post_id": ids['other_post_id'], "dir": 1}, {"post_id": ids['post_id'], "dir": 0}], 2),
+    ("get", "/users/{user_id}", None, 1),
+])
+def test_query_budget(authorized_client: TestClient, test_user: dict, test_posts: list, assert_max_queries,
+                      method: str, url: str, body, budget: int):
+    ids = {"post_id": test_posts[0].id, "other_post_id": test_posts[3].id, "user_id": test_user['id']}
+    kwargs = {"json": body(ids)} if body else {}
+
+    with assert_max_queries(budget):
+        res = getattr(authorized_client, method)(url.format(**ids), **kwargs)
+    assert res.status_code < 300
+
+
+def test_signup_and_login_query_budget(client: TestClient, assert_max_queries):
+    credentials = {"email": "hello123@gmail.com", "password": "password123"}
+    with assert_max_queries(2):
+        assert client.post("/users/", json=credentials).status_code == 201
+    with assert_max_queries(1):
+        assert client.post("/login", data={
+            "username": credentials['email'], "password": credentials['password']}).status_code == 200
+
+
+@pytest.mark.parametrize("method, body", [
+    ("put", {"title": "updated title", "content": "updated content"}),
+    ("delete", None),
+])
+def test_rejected_mutation_query_budget(authorized_client: TestClient, test_posts: list, assert_max_queries,
+                                        method: str, body):
+    kwargs = {"json": body} if body else {}
+    # ? the guarded statement matches nothing, then one probe tells 403 from 404
+    with assert_max_queries(2):
+        assert getattr(authorized_client, method)(f"/posts/{test_posts[3].id}", **kwargs).status_code == 403
+    with assert_max_queries(2):
+        assert getattr(authorized_client, method)("/posts/88888", **kwargs).status_code == 404
@@ -0,0 +1,88 @@
+from fastapi.testclient import TestClient
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.database import Base, ReplicaRouter, replica_router
+from app.oauth2 import create_access_token
+from .conftest import SQLALCHEMY_DATABASE_URL, engine
+
+
+# ? a second database stands in for a replica that hasn't replayed anything yet: same schema, no rows
+REPLICA_DATABASE_URL = SQLALCHEMY_DATABASE_URL + "_replica"
+
+
+@pytest.fixture(scope="module")
+def replica_database():
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        name = REPLICA_DATABASE_URL.rsplit("/", 1)[1]
+        if not conn.execute(text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": name}).first():
+            conn.execute(text(f'CREATE DATABASE "{name}"'))
+
+    replica_engine = create_engine(REPLICA_DATABASE_URL)
+    Base.metadata.drop_all(bind=replica_engine)
+    Base.metadata.create_all(bind=replica_engine)
+    replica_engine.dispose()
+    return REPLICA_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+
+@pytest.fixture
+def replica(replica_database: str, monkeypatch):
+    routed = ReplicaRouter([create_async_engine(replica_database, poolclass=NullPool)], sticky_seconds=60)
+    for name, value in vars(routed).items():
+        monkeypatch.setattr(replica_router, name, value)
+    return replica_router
+
+
+def test_reads_go_to_replica(authorized_client: TestClient, test_user: dict, test_posts: list, replica):
+    assert authorized_client.get("/posts/").json() == []
+    assert authorized_client.get(f"/posts/{test_posts[0].id}").status_code == 404
+    assert authorized_client.get(f"/users/{test_user['id']}").status_code == 404
+    assert replica.snapshot() == {"replicas": 1, "replica_reads": 3, "primary_reads": 0}
+
+
+def test_read_your_writes(authorized_client: TestClient, test_user2: dict, test_posts: list, replica):
+    res = authorized_client.post("/posts/", json={"title": "new title", "content": "new content"})
+    assert res.status_code == 201
+
+    # ? the writer reads from the primary for the sticky window
+    assert len(authorized_client.get("/posts/").json()) == len(test_posts) + 1
+    assert authorized_client.get(f"/posts/{res.json()['id']}").status_code == 200
+
+    # ? everyone else still reads the replica, and what they read isn't cached while the replica may lag
+    other_token = create_access_token({"user_id": test_user2['id']})
+    res = authorized_client.get("/posts/", params={"limit": 3}, headers={"Authorization": f"Bearer {other_token}"})
+    assert res.json() == []
+    assert replica.snapshot() == {"replicas": 1, "replica_reads": 1, "primary_reads": 2}
+    assert len(authorized_client.get("/posts/", params={"limit": 3}).json()) == 3
+
+
+def test_read_your_signup(client: TestClient, replica):
+    res = client.post("/users/", json={"email": "new@example.com", "password": "password123"})
+    assert res.status_code == 201
+
+    # ? the replica has no users yet, the new user is read from the primary for the sticky window
+    assert client.get(f"/users/{res.json()['id']}").status_code == 200
+    assert replica.snapshot() == {"replicas": 1, "replica_reads": 0, "primary_reads": 1}
+
+
+def test_replica_router_round_robin_and_stickiness():
+    router = ReplicaRouter(["replica-a", "replica-b"], sticky_seconds=60)
+    assert [router.replica_for(1) for _ in range(3)] == ["replica-a", "replica-b", "replica-a"]
+
+    router.mark_write(1)
+    assert router.replica_for(1) is None
+    assert router.replica_for(2) == "replica-b"
+    assert router.replica_for() == "replica-a"
+
+    expired = ReplicaRouter(["replica-a"], sticky_seconds=0)
+    expired.mark_write(1)
+    assert expired.replica_for(1) == "replica-a"
+    assert not expired.replicas_may_lag()
+
+
+def test_no_replicas_reads_primary():
+    router = ReplicaRouter([], sticky_seconds=60)
+    assert router.replica_for(1) is None
+    assert router.snapshot() == {"replicas": 0, "replica_reads": 0, "primary_reads": 1}
@@ -0,0 +1,55 @@
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+import pytest
+
+from app import database, oauth2, utils
+from app.cache import NullBackend, response_cache
+from app.config import settings
+from app.counters import vote_counter
+from app.main import create_app
+
+
+LAZY_MODULES = ["click", "psycopg2", "asyncpg", "jose", "passlib"]
+
+
+def test_import_has_no_side_effects():
+    # ! a fresh interpreter, this one already imported everything through conftest
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import sys, app.main; from app.config import settings; "
+                               f"print([m for m in {LAZY_MODULES!r} if m in sys.modules], settings._settings)"],
+        capture_output=True, text=True, check=True).stdout.strip()
+    assert loaded == "[] None"
+
+
+@pytest.fixture
+def app_settings():
+    # ? create_app() configures the whole process, the app the other tests use gets its settings back
+    original = settings.get()
+    yield original
+    create_app(original)
+
+
+def test_create_app_follows_its_settings(app_settings):
+    create_app(app_settings.copy(update={
+        "vote_counter_enabled": True, "cache_backend": "none", "user_cache_max_size": 7, "token_cache_max_size": 8,
+        "password_hash_workers": 2, "password_hash_max_queue": 3, "replica_sticky_seconds": 9,
+        "post_bulk_max_size": 10, "bcrypt_rounds": 4}))
+
+    assert vote_counter.enabled
+    assert isinstance(response_cache.backend, NullBackend)
+    assert (oauth2.user_cache.max_size, oauth2.token_cache.max_size) == (7, 8)
+    assert (utils.password_hasher.workers, utils.password_hasher.max_queue) == (2, 3)
+    assert database.replica_router.sticky_seconds == 9
+    assert settings.post_bulk_max_size == 10
+    assert utils.hash("password123").startswith("$2b$04$")
+
+
+def test_create_app_instrumentation(app_settings):
+    instrumented = create_app(app_settings.copy(update={"sql_instrumentation": True}))
+    with TestClient(instrumented) as client:
+        res = client.get("/")
+    assert res.status_code == 200
+    assert res.headers["server-timing"].startswith("db;")
+    assert "server-timing" not in TestClient(create_app(app_settings)).get("/").headers
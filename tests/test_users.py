@@ -1,8 +1,11 @@
+import asyncio
+import threading
+
 from jose import jwt
 from fastapi.testclient import TestClient
 import pytest
 
-from app import schemas
+from app import schemas, utils
 from app.config import settings
 
 
@@ -22,6 +25,16 @@ def test_create_user(client: TestClient):
     assert new_user.email == "hello123@gmail.com"
     assert res.status_code == 201
 
+def test_create_duplicate_user_skips_hashing(client: TestClient, test_user: dict, monkeypatch):
+    def fail(*args):
+        raise AssertionError("duplicate signup must not hash the password")
+    monkeypatch.setattr(utils, "hash", fail)
+
+    res = client.post("/users/", json={
+        "email": test_user['email'], 
+        "password": "password123"})
+    assert res.status_code == 409
+
 def test_login_user(client: TestClient, test_user: dict):
     res = client.post("/login", data={
         "username": test_user['email'], 
@@ -51,4 +64,42 @@ def test_incorrect_login(client: TestClient, test_user: dict, email: str, passwo
     
     assert res.status_code == status_code
     # assert res.json().get('detail') == "Invalid credentials"
-    
\ No newline at end of file
+
+
+def test_hash_uses_configured_bcrypt_rounds():
+    assert utils.hash("password123").startswith(f"$2b${settings.bcrypt_rounds:02d}$")
+
+
+def test_password_hasher_rejects_when_queue_full():
+    hasher = utils.PasswordHasher(workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def burst():
+        running = [asyncio.ensure_future(hasher.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert hasher.snapshot()["queue_depth"] == 1
+        with pytest.raises(utils.PasswordHasherBusy):
+            await hasher.run(release.wait)
+        release.set()
+        await asyncio.gather(*running)
+
+    asyncio.run(burst())
+    assert hasher.snapshot() == {
+        "workers": 1, "in_flight": 0, "queue_depth": 0, "completed": 2, "rejected": 1}
+
+
+def test_create_user_hasher_busy(client: TestClient, monkeypatch):
+    async def busy(*args):
+        raise utils.PasswordHasherBusy()
+    monkeypatch.setattr(utils.password_hasher, "run", busy)
+
+    res = client.post("/users/", json={
+        "email": "hello123@gmail.com", 
+        "password": "password123"})
+    assert res.status_code == 503
+    assert res.headers["Retry-After"] == "1"
+
+
+@pytest.mark.parametrize("id", [99999999999, -99999999999])
+def test_get_user_id_out_of_int_range(client: TestClient, id: int):
+    assert client.get(f"/users/{id}").status_code == 422
@@ -1,9 +1,18 @@
+import asyncio
+import threading
+import time
 from hashlib import new
 from fastapi.testclient import TestClient
 import pytest
+from sqlalchemy import func, insert, update
 from sqlalchemy.orm import Session
 
-from app import models
+from app import models, schemas
+from app.backfill import backfill_vote_counts
+from app.config import settings
+from app.counters import VoteCounter, vote_counter
+from app.oauth2 import create_access_token
+from .conftest import TestingAsyncSessionLocal, engine
 
 
 
@@ -11,15 +20,24 @@ from app import models
 def test_vote(test_user: dict, test_posts: list, session: Session):
     new_vote = models.Vote(post_id=test_posts[3].id, user_id=test_user['id'])
     session.add(new_vote)
+    session.query(models.Post).filter(models.Post.id == test_posts[3].id).update(
+        {models.Post.vote_count: models.Post.vote_count + 1}, synchronize_session=False)
     session.commit()
 
 
+def get_votes(client: TestClient, post_id: int) -> int:
+    res = client.get(f"/posts/{post_id}")
+    return schemas.PostOut(**res.json()).votes
+
+
 def test_vote_on_post(authorized_client: TestClient, test_posts: list):
+    post_id = test_posts[3].id
     res = authorized_client.post("/vote/", json={
-        "post_id": test_posts[3].id,
+        "post_id": post_id,
         "dir": 1
         })
     assert res.status_code == 201
+    assert get_votes(authorized_client, post_id) == 1
 
 
 def test_vote_twice_post(authorized_client: TestClient, test_posts: list, test_vote: None):
@@ -31,11 +49,13 @@ def test_vote_twice_post(authorized_client: TestClient, test_posts: list, test_v
 
 
 def test_delete_vote(authorized_client: TestClient, test_posts: list, test_vote: None):
+    post_id = test_posts[3].id
     res = authorized_client.post("/vote/", json={
-        "post_id": test_posts[3].id,
+        "post_id": post_id,
         "dir": 0
     })
     assert res.status_code == 201
+    assert get_votes(authorized_client, post_id) == 0
 
 
 def test_delete_vote_non_exist(authorized_client: TestClient, test_posts: list):
@@ -54,9 +74,186 @@ def test_vote_post_non_exist(authorized_client: TestClient, test_posts: list):
     assert res.status_code == 404
 
 
+@pytest.mark.parametrize("post_id", [99999999999, -99999999999])
+def test_vote_post_id_out_of_int_range(authorized_client: TestClient, test_posts: list, post_id: int):
+    assert authorized_client.post("/vote/", json={"post_id": post_id, "dir": 1}).status_code == 422
+    assert authorized_client.post("/vote/batch", json=[{"post_id": post_id, "dir": 1}]).status_code == 422
+
+
+def test_delete_vote_post_non_exist(authorized_client: TestClient, test_posts: list):
+    res = authorized_client.post("/vote/", json={
+        "post_id": 88888,
+        "dir": 0
+    })
+    assert res.status_code == 404
+
+
 def test_vote_unauthorized_user(client: TestClient, test_posts: list):
     res = client.post("/vote/", json={
         "post_id": test_posts[3].id,
         "dir": 1
     })
     assert res.status_code == 401
+
+
+def test_backfill_vote_counts(test_user: dict, test_user2: dict, test_posts: list, session: Session):
+    session.add_all([
+        models.Vote(post_id=test_posts[0].id, user_id=test_user['id']),
+        models.Vote(post_id=test_posts[0].id, user_id=test_user2['id']),
+        models.Vote(post_id=test_posts[1].id, user_id=test_user['id']),
+    ])
+    session.commit()
+
+    assert backfill_vote_counts(session, batch_size=2) == 2
+    counts = {post.id: post.vote_count for post in session.query(models.Post).all()}
+    assert counts == {
+        test_posts[0].id: 2, test_posts[1].id: 1, test_posts[2].id: 0, test_posts[3].id: 0}
+
+
+def test_backfill_keeps_votes_in_flight(test_user: dict, test_posts: list, session: Session):
+    post_id = test_posts[0].id
+    session.query(models.Post).filter(models.Post.id == post_id).update({"vote_count": 5}) # ! drifted, needs the backfill
+    session.commit()
+    # ? a vote transaction that wrote its votes row and +1 but hasn't committed yet
+    with engine.connect() as voter:
+        in_flight = voter.begin()
+        voter.execute(insert(models.Vote).values(post_id=post_id, user_id=test_user['id']))
+        voter.execute(update(models.Post).where(models.Post.id == post_id).values(vote_count=models.Post.vote_count + 1))
+
+        backfill = threading.Thread(target=backfill_vote_counts, args=(session,))
+        backfill.start()
+        time.sleep(0.2)
+        in_flight.commit()
+        backfill.join()
+
+    session.expire_all()
+    assert session.get(models.Post, post_id).vote_count == 1
+
+
+def test_vote_batch(authorized_client: TestClient, test_posts: list, test_vote: None):
+    post_ids = [post.id for post in test_posts]
+    res = authorized_client.post("/vote/batch", json=[
+        {"post_id": post_ids[0], "dir": 1},
+        {"post_id": post_ids[3], "dir": 1},
+        {"post_id": 88888, "dir": 1},
+        {"post_id": post_ids[1], "dir": 0},
+    ])
+    assert res.status_code == 200
+    assert [(x['post_id'], x['status_code']) for x in res.json()] == [
+        (post_ids[0], 201), (post_ids[3], 409), (88888, 404), (post_ids[1], 404)]
+    assert get_votes(authorized_client, post_ids[0]) == 1
+
+    res = authorized_client.post("/vote/batch", json=[{"post_id": post_ids[3], "dir": 0}])
+    assert res.json()[0]['status_code'] == 201
+    assert get_votes(authorized_client, post_ids[3]) == 0
+
+
+def test_vote_batch_duplicate_post(authorized_client: TestClient, test_posts: list):
+    post_id = test_posts[0].id
+    res = authorized_client.post("/vote/batch", json=[
+        {"post_id": post_id, "dir": 1},
+        {"post_id": post_id, "dir": 0},
+    ])
+    assert res.status_code == 422
+
+
+def test_vote_batch_too_large(authorized_client: TestClient, test_posts: list, monkeypatch):
+    monkeypatch.setattr(settings, "vote_batch_max_size", 2)
+    res = authorized_client.post("/vote/batch", json=[
+        {"post_id": post.id, "dir": 1} for post in test_posts])
+    assert res.status_code == 413
+
+
+def test_vote_batch_too_large_before_validation(authorized_client: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "vote_batch_max_size", 2)
+    res = authorized_client.post("/vote/batch", json=[{"post_id": "not an id", "dir": 5}] * 3)
+    assert res.status_code == 413
+
+
+@pytest.fixture
+def buffered_votes(monkeypatch):
+    counter = VoteCounter(enabled=True)
+    for name, value in vars(counter).items():
+        monkeypatch.setattr(vote_counter, name, value)
+    return vote_counter
+
+
+def db_vote_counts(session: Session) -> dict:
+    session.expire_all()
+    return dict(session.query(models.Post.id, models.Post.vote_count).all())
+
+
+def test_buffered_votes_served_before_flush(authorized_client: TestClient, test_posts: list, session: Session, buffered_votes):
+    post_id = test_posts[3].id
+    etag = authorized_client.get(f"/posts/{post_id}").headers["etag"]
+
+    assert authorized_client.post("/vote/", json={"post_id": post_id, "dir": 1}).status_code == 201
+    assert db_vote_counts(session)[post_id] == 0    # posts row untouched until the flush
+    assert get_votes(authorized_client, post_id) == 1
+    assert authorized_client.get(f"/posts/{post_id}", headers={"If-None-Match": etag}).status_code == 200
+
+    assert asyncio.run(flush(buffered_votes)) == 1
+    assert db_vote_counts(session)[post_id] == 1
+    assert buffered_votes.pending(post_id) == 0
+    assert get_votes(authorized_client, post_id) == 1
+
+
+def test_buffered_votes_converge_to_votes_table(authorized_client: TestClient, test_user2: dict, test_posts: list,
+                                                session: Session, buffered_votes):
+    post_ids = [post.id for post in test_posts]
+    other_client = TestClient(authorized_client.app)
+    other_client.headers["Authorization"] = f"Bearer {create_access_token({'user_id': test_user2['id']})}"
+
+    for client in (authorized_client, other_client):
+        client.post("/vote/batch", json=[{"post_id": post_id, "dir": 1} for post_id in post_ids])
+    authorized_client.post("/vote/", json={"post_id": post_ids[0], "dir": 0})
+    asyncio.run(flush(buffered_votes))   # flushes interleave with new votes
+    other_client.post("/vote/batch", json=[{"post_id": post_ids[1], "dir": 0}, {"post_id": post_ids[2], "dir": 0}])
+    authorized_client.post("/vote/", json={"post_id": post_ids[0], "dir": 1})
+    authorized_client.post("/vote/", json={"post_id": post_ids[0], "dir": 1})    # 409, counts nothing
+    asyncio.run(flush(buffered_votes))
+
+    expected = dict.fromkeys(post_ids, 0)
+    expected.update(session.query(models.Vote.post_id, func.count()).group_by(models.Vote.post_id).all())
+    assert db_vote_counts(session) == expected
+    assert {post_id: get_votes(authorized_client, post_id) for post_id in post_ids} == expected
+
+
+def test_flush_invalidates_cached_post_detail(authorized_client: TestClient, test_posts: list, buffered_votes):
+    # ? stands in for a worker sharing the cache: it cached the post without the deltas this worker buffers
+    post_id = test_posts[2].id
+    assert get_votes(authorized_client, post_id) == 0
+    buffered_votes.add({post_id: 1})
+
+    asyncio.run(flush(buffered_votes))
+    assert get_votes(authorized_client, post_id) == 1
+
+
+def test_failed_flush_keeps_deltas(buffered_votes):
+    class BrokenSession:
+        async def execute(self, *args, **kwargs):
+            raise ConnectionError("database went away")
+
+    buffered_votes.add({1: 1, 2: -1})
+    with pytest.raises(ConnectionError):
+        asyncio.run(buffered_votes.flush(BrokenSession()))
+    assert (buffered_votes.pending(1), buffered_votes.pending(2)) == (1, -1)
+    assert buffered_votes.snapshot()["failed_flushes"] == 1
+
+
+def test_vote_counter_flushes_on_stop(authorized_client: TestClient, test_posts: list, session: Session, buffered_votes):
+    post_id = test_posts[0].id
+
+    async def run():
+        buffered_votes.start(TestingAsyncSessionLocal, interval=3600)
+        buffered_votes.add({post_id: 1})
+        await buffered_votes.stop(TestingAsyncSessionLocal)
+
+    asyncio.run(run())
+    assert db_vote_counts(session)[post_id] == 1
+    assert buffered_votes.snapshot()["pending_posts"] == 0
+
+
+async def flush(counter: VoteCounter) -> int:
+    async with TestingAsyncSessionLocal() as db:
+        return await counter.flush(db)